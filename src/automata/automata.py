@@ -1,7 +1,12 @@
 # TLS自动机相关操作
 from typing import List, Dict, Tuple, Set, Iterator, Optional
-from itertools import combinations, product
+from collections import deque
+from itertools import combinations
 import hashlib
+import heapq
+import io
+import multiprocessing
+import struct
 import pylstar.automata.Automata
 
 
@@ -21,6 +26,9 @@ class IndistinguishableSetOfAutomata(BaseException):
     pass
 
 
+# 二进制格式状态机文件的开头
+BINARY_AUTOMATON_MAGIC = b"\x89TLSA"
+
 Path = List[Tuple[int, str]]
 # 状态转移 [input_word, (output_state, output_words, colors)]
 # colors代表路径是否合法
@@ -43,13 +51,84 @@ def use_star_and_prefer_green(colors):
     return colors, len(colors) == 0
 
 
+# Hopcroft划分细化，复杂度O(n·k·log n)
+# successors[s][i]为状态s收到第i个输入后的状态，outputs[s][i]为对应输出的整数编码
+# 返回每个状态所在块的编号，同一块中的状态行为等价
+def refine_partition(successors: List[List[int]], outputs: List[List[int]]) -> List[int]:
+    nb_inputs = len(successors[0]) if successors else 0
+
+    # 初始划分：输出相同的状态放在同一块
+    signatures: Dict[Tuple[int, ...], int] = {}
+    block_of = [signatures.setdefault(tuple(row), len(signatures)) for row in outputs]
+    blocks: List[Set[int]] = [set() for _ in signatures]
+    for state, block in enumerate(block_of):
+        blocks[block].add(state)
+
+    # 逆转移表 predecessors[i][s] = 收到第i个输入后转移到s的状态
+    predecessors: List[List[List[int]]] = [[[] for _ in successors] for _ in range(nb_inputs)]
+    for state, row in enumerate(successors):
+        for index, next_state in enumerate(row):
+            predecessors[index][next_state].append(state)
+
+    waiting = [(block, index) for block in range(len(blocks)) for index in range(nb_inputs)]
+    in_waiting = set(waiting)
+    while waiting:
+        splitter = waiting.pop()
+        in_waiting.discard(splitter)
+        splitter_block, index = splitter
+
+        # 按所在块收集能转移到splitter块的状态
+        touched: Dict[int, Set[int]] = {}
+        for target in blocks[splitter_block]:
+            for state in predecessors[index][target]:
+                touched.setdefault(block_of[state], set()).add(state)
+
+        for block, states in touched.items():
+            if len(states) == len(blocks[block]):
+                continue
+            blocks[block] -= states
+            new_block = len(blocks)
+            blocks.append(states)
+            for state in states:
+                block_of[state] = new_block
+            # 只需将较小的一半加入待处理集合
+            for i in range(nb_inputs):
+                if (block, i) in in_waiting or len(states) <= len(blocks[block]):
+                    entry = (new_block, i)
+                else:
+                    entry = (block, i)
+                waiting.append(entry)
+                in_waiting.add(entry)
+
+    return block_of
+
+
+# 以长度前缀的形式将字符串序列写入哈希，保证编码无歧义
+def _hash_strings(digest, strings):
+    digest.update(struct.pack("<i", len(strings)))
+    for string in strings:
+        data = string.encode("utf-8")
+        digest.update(struct.pack("<i", len(data)))
+        digest.update(data)
+
+
+# 合并两个状态之间颜色相同的平行边，标签之间换行
+def _merge_parallel_labels(labels):
+    merged: Dict[Tuple[int, Optional[str]], List[str]] = {}
+    for edge, label in labels:
+        merged.setdefault(edge, []).append(label)
+    return [(edge, "\\n".join(edge_labels)) for edge, edge_labels in merged.items()]
+
+
 # 自动机
 class Automaton:
     def __init__(self, input_vocabulary: Set[str]):
         # states = Dict[input_state, Dict[input_word, Tuple(output_state, output_words, colors)]]
         self.states: Dict[int, TransitionList] = {}
         self.input_vocabulary = input_vocabulary
+        # 缓存，状态机被修改时清空
         self.hash: Optional[bytes] = None
+        self.table = None
 
     def __str__(self):
         vocabulary = list(self.input_vocabulary)
@@ -64,19 +143,84 @@ class Automaton:
                 )
         return "\n".join(result)
 
+    # 规范形式的哈希值，结果会被缓存，直到状态机被修改
     def compute_hash(self) -> bytes:
         if not self.hash:
-            complete_automaton = self.reorder_states()
-            automaton_repr = str(complete_automaton).encode("utf-8")
-            self.hash = hashlib.md5(automaton_repr).digest()
+            self.hash = self._canonical_digest()
         return self.hash
 
+    # 按browse_automaton_and_build_mapping给出的状态顺序，将整数编码的状态转移
+    # 逐行写入哈希，不生成中间状态机和字符串
+    # 输出序列按首次出现的顺序编号，每行之后写入该行新出现的输出序列
+    def _canonical_digest(self) -> bytes:
+        state_mapping = self.browse_automaton_and_build_mapping()
+        vocabulary = sorted(self.input_vocabulary)
+        digest = hashlib.md5()
+        _hash_strings(digest, vocabulary)
+
+        output_ids: Dict[Tuple[str, ...], int] = {}
+        for state in state_mapping:
+            transitions = self.states[state]
+            row = []
+            new_outputs = []
+            for word in vocabulary:
+                output_state, output_words, _ = transitions[word]
+                key = tuple(output_words)
+                if key not in output_ids:
+                    output_ids[key] = len(output_ids)
+                    new_outputs.append(key)
+                row.append(state_mapping[output_state])
+                row.append(output_ids[key])
+            digest.update(struct.pack(f"<{len(row)}i", *row))
+            digest.update(struct.pack("<i", len(new_outputs)))
+            for output_words in new_outputs:
+                _hash_strings(digest, output_words)
+        return digest.digest()
+
     def __eq__(self, other):
         return self.compute_hash() == other.compute_hash()
 
+    # Hopcroft-Karp等价性检查：从两个初始状态出发，用并查集合并行为相同的状态对
+    # 返回(是否等价, 反例)，反例为第一个产生不同输出的输入序列
+    def equivalent(self, other: "Automaton") -> Tuple[bool, Optional[List[str]]]:
+        if self.input_vocabulary != other.input_vocabulary:
+            raise DifferentInputVocabulary
+
+        vocabulary = sorted(self.input_vocabulary)
+        # 并查集的元素为(0, self中的状态)与(1, other中的状态)
+        parents: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+        def find(element):
+            root = element
+            while root in parents:
+                root = parents[root]
+            while element in parents and parents[element] != root:
+                parents[element], element = root, parents[element]
+            return root
+
+        parents[(0, 0)] = (1, 0)
+        to_visit = deque([(0, 0, [])])
+        while to_visit:
+            state1, state2, word = to_visit.popleft()
+            for msg in vocabulary:
+                next_state1, recv_msgs1, _ = self.states[state1][msg]
+                next_state2, recv_msgs2, _ = other.states[state2][msg]
+                if recv_msgs1 != recv_msgs2:
+                    return False, word + [msg]
+                root1 = find((0, next_state1))
+                root2 = find((1, next_state2))
+                if root1 != root2:
+                    parents[root1] = root2
+                    to_visit.append((next_state1, next_state2, word + [msg]))
+        return True, None
+
+    def _invalidate_caches(self):
+        self.hash = None
+        self.table = None
+
     # 添加状态
     def add_state(self, state: int):
-        self.hash = None
+        self._invalidate_caches()
         if state not in self.states:
             self.states[state] = {}
 
@@ -92,7 +236,7 @@ class Automaton:
     ):
         if input_word not in self.input_vocabulary and input_word != "*":
             raise IncompleteInputVocabulary(input_word, self.input_vocabulary)
-        self.hash = None
+        self._invalidate_caches()
         self.add_state(input_state)
         self.add_state(output_state)
         if not colors:
@@ -107,6 +251,21 @@ class Automaton:
                 if word not in self.states[input_state]:
                     self.states[input_state][word] = (output_state, output_words, colors)
 
+    # 整数编码、基于数组的状态转移表(automata.table.TransitionTable)
+    # 结果会被缓存，直到状态机被修改或着色
+    def to_table(self):
+        if self.table is None:
+            # pylint: disable=import-outside-toplevel
+            from automata.table import TransitionTable
+            self.table = TransitionTable.from_automaton(self)
+        return self.table
+
+    # 重命名、删除输入消息的只读视图(automata.views.AutomatonView)，不复制状态转移
+    def view(self):
+        # pylint: disable=import-outside-toplevel
+        from automata.views import AutomatonView
+        return AutomatonView(self)
+
     # 返回某个状态收到某条消息的状态转移
     # [output_state, output_words, colors]
     def follow_transition(self, state: int, msg: str):
@@ -130,7 +289,7 @@ class Automaton:
     # 根据初始状态图进行状态排序，确保初始状态为0，终止状态为状态中的最大值
     # 返回的是初始状态图中状态到排序后状态的映射关系
     def browse_automaton_and_build_mapping(self) -> Dict[int, int]:
-        src_states_to_visit = [0]
+        src_states_to_visit = deque([0])
         src_sink_states_to_visit: List[int] = []
         state_mapping = {}
         dst_current_state = 0
@@ -138,7 +297,7 @@ class Automaton:
 
         # 非sink状态
         while src_states_to_visit:
-            src_current_state = src_states_to_visit.pop(0)
+            src_current_state = src_states_to_visit.popleft()
             state_mapping[src_current_state] = dst_current_state
             dst_current_state += 1
 
@@ -153,8 +312,7 @@ class Automaton:
                     src_states_to_visit.append(output_state)
 
         # sink状态
-        while src_sink_states_to_visit:
-            src_current_state = src_sink_states_to_visit.pop(0)
+        for src_current_state in src_sink_states_to_visit:
             state_mapping[src_current_state] = dst_current_state
             dst_current_state += 1
 
@@ -181,22 +339,9 @@ class Automaton:
                                       colors)
         return result
 
+    # 删除一条输入消息，原状态机(包括输入集)保持不变
     def remove_input_word(self, word_to_remove):
-        new_vocabulary = self.input_vocabulary
-        new_vocabulary.remove(word_to_remove)
-        result = Automaton(new_vocabulary)
-        # 遍历状态转移表
-        for input_state, transitions in self.states.items():
-            for input_word in transitions:
-                if input_word == word_to_remove:
-                    continue
-                output_state, output_words, colors = transitions[input_word]
-                result.add_transition(input_state,
-                                      output_state,
-                                      input_word,
-                                      output_words,
-                                      colors)
-        return result.reorder_states()
+        return self.view().remove_input_word(word_to_remove).materialize()
 
     def contains_transition_with_received_msg(self, msg):
         for transitions in self.states.values():
@@ -206,23 +351,39 @@ class Automaton:
         return False
 
     def enumerate_paths_until_recv_msg(self, expected_msg: str) -> Iterator[Path]:
-        yield from self._enumerate_paths_until_recv_msg(0, [], expected_msg)
-
-    # dfs 查找目标信息
-    # path是已访问节点
-    def _enumerate_paths_until_recv_msg(
-            self, state: int, path: Path, expected_msg: str
-    ) -> Iterator[Path]:
-        for sent_msg in self.states[state]:
-            next_state, recv_msgs, _ = self.states[state][sent_msg]
-            new_path = path + [(state, sent_msg)]
-            previous_states = [link[0] for link in new_path]
-            # 当前状态的下一个状态之前没有遍历过
-            if next_state not in previous_states:
-                if expected_msg in recv_msgs:
-                    yield new_path
-                else:
-                    yield from self._enumerate_paths_until_recv_msg(next_state, new_path, expected_msg)
+        yield from self._enumerate_paths_until_recv_msg(0, expected_msg)
+
+    # 用显式栈实现的dfs 查找目标信息
+    # path是当前路径，所有结果共享同一个路径，产出时才复制
+    # on_path以位图形式记录当前路径上的状态
+    def _enumerate_paths_until_recv_msg(self, state: int, expected_msg: str) -> Iterator[Path]:
+        path: Path = []
+        path_states = [state]
+        on_path = 1 << state
+        to_visit = [iter(self.states[state].items())]
+        while to_visit:
+            transition = next(to_visit[-1], None)
+            if transition is None:
+                to_visit.pop()
+                on_path &= ~(1 << path_states.pop())
+                if path:
+                    path.pop()
+                continue
+
+            sent_msg, (next_state, recv_msgs, _) = transition
+            # 下一个状态已经在当前路径上
+            if on_path >> next_state & 1:
+                continue
+            current_state = path_states[-1]
+            if expected_msg in recv_msgs:
+                path.append((current_state, sent_msg))
+                yield list(path)
+                path.pop()
+            else:
+                path.append((current_state, sent_msg))
+                path_states.append(next_state)
+                on_path |= 1 << next_state
+                to_visit.append(iter(self.states[next_state].items()))
 
     # 根据抽象的正确路径找到状态机中的那条正确路径
     # 抽象路径类似TLS成功握手发送的那些消息类型
@@ -242,20 +403,34 @@ class Automaton:
 
     # 对路径着色
     def color_path(self, path: Path, color: str):
+        # 颜色不影响哈希值，只需要清空转移表
+        self.table = None
         for state, sent_msg in path:
             _, _, colors = self.follow_transition(state, sent_msg)
             colors.add(color)
 
     # 将状态机格式化输出
     # ------------------------------------------------------------------
-    def dot(self, dot_policy=None):
-        states = []
-        transitions = []
+    def dot(self, dot_policy=None, compact=False):
+        dot_file = io.StringIO()
+        self.dot_to(dot_file, dot_policy, compact)
+        return dot_file.getvalue()
+
+    # 逐行写入dot内容，不生成完整的字符串
+    # compact为True时，两个状态之间颜色相同的平行边合并为一条边，标签每行对应一组转移
+    def dot_to(self, dot_file, dot_policy=None, compact=False):
+        dot_file.write("digraph {\n")
         # 遍历所有状态
         for state in sorted(self.states):
-            states.append(self._dot_state(state))
-            transitions_to_merge: Dict[str, List[str]] = {}
-            starrable_transitions: Set[str] = set()
+            dot_file.write(self._dot_state(state))
+            dot_file.write("\n")
+
+        # 输出序列的整数编码，以及对应的字符串
+        recv_msgs_ids: Dict[str, int] = {}
+        recv_msgs_strs: List[str] = []
+        for state in sorted(self.states):
+            transitions_to_merge: Dict[Tuple[int, int, Optional[str]], List[str]] = {}
+            starrable_transitions: Set[Tuple[int, int, Optional[str]]] = set()
             # 遍历一个状态对应的所有路径
             for sent_msg in sorted(self.states[state]):
                 self._register_transition(
@@ -264,9 +439,23 @@ class Automaton:
                     state,
                     sent_msg,
                     dot_policy,
+                    recv_msgs_ids,
+                    recv_msgs_strs,
                 )
-            transitions.extend(self._commit_transitions(transitions_to_merge, starrable_transitions))
-        return "digraph {\n" + "\n".join(states + transitions) + "\n}\n"
+            labels = self._commit_transitions(
+                transitions_to_merge, starrable_transitions, recv_msgs_strs
+            )
+            if compact:
+                labels = _merge_parallel_labels(labels)
+            for (next_state, color), label in labels:
+                if color:
+                    dot_file.write(
+                        f'"{state}" -> "{next_state}" [label="{label}", '
+                        f'color="{color}", fontcolor="{color}"];\n'
+                    )
+                else:
+                    dot_file.write(f'"{state}" -> "{next_state}" [label="{label}"];\n')
+        dot_file.write("}\n")
 
     def _dot_state(self, state):
         if state == 0:
@@ -277,140 +466,133 @@ class Automaton:
             shape = "ellipse"
         return f'"{state}" [shape={shape} label={state}];'
 
+    # 转移按(下一个状态, 输出编号, 颜色)合并
+    # pylint: disable=too-many-arguments
     def _register_transition(self,
-                             transitions_to_merge: Dict[str, List[str]],
+                             transitions_to_merge,
                              starrable_transitions,
                              state,
                              sent_msg,
-                             dot_policy):
+                             dot_policy,
+                             recv_msgs_ids,
+                             recv_msgs_strs):
         next_state, recv_msgs, colors = self.states[state][sent_msg]
         # output_words之间用"+"连接
         recv_msgs_str = "+".join(recv_msgs)
-        params = f'label="%s / {recv_msgs_str}"'
+        recv_msgs_id = recv_msgs_ids.get(recv_msgs_str)
+        if recv_msgs_id is None:
+            recv_msgs_id = recv_msgs_ids[recv_msgs_str] = len(recv_msgs_strs)
+            recv_msgs_strs.append(recv_msgs_str)
         if dot_policy:
             colors, starrable = dot_policy(colors)
         else:
             starrable = False
 
-        # line_to_fill = "0" -> "1" [label="%s / recv_msgs_str"];
-        lines_to_fill = []
         if colors:
-            for color in sorted(colors):
-                lines_to_fill.append(
-                    f'"{state}" -> "{next_state}" [{params}, color="{color}", fontcolor="{color}"];'
-                )
+            keys = [(next_state, recv_msgs_id, color) for color in sorted(colors)]
         else:
-            lines_to_fill = [f'"{state}" -> "{next_state}" [{params}];']
+            keys = [(next_state, recv_msgs_id, None)]
 
-        for line_to_fill in lines_to_fill:
+        for key in keys:
             if starrable:
-                starrable_transitions.add(line_to_fill)
-            if line_to_fill not in transitions_to_merge:
-                transitions_to_merge[line_to_fill] = []
-            transitions_to_merge[line_to_fill].append(sent_msg)
-
-    def _commit_transitions(self, transitions_to_merge, starrable_transitions):
-        star_line = None
+                starrable_transitions.add(key)
+            if key not in transitions_to_merge:
+                transitions_to_merge[key] = []
+            transitions_to_merge[key].append(sent_msg)
+
+    # 返回[((next_state, color), label)]，label = "sent_msgs_str / recv_msgs_str"
+    @staticmethod
+    def _commit_transitions(transitions_to_merge, starrable_transitions, recv_msgs_strs):
+        star_key = None
         max_factor = 0
-        for line_to_fill in transitions_to_merge:
+        for key in transitions_to_merge:
             # sent_msgs的长度
-            factor = len(transitions_to_merge[line_to_fill])
-            if line_to_fill in starrable_transitions and factor > max_factor:
+            factor = len(transitions_to_merge[key])
+            if key in starrable_transitions and factor > max_factor:
                 max_factor = factor
-                star_line = line_to_fill
+                star_key = key
         if max_factor <= 1:
-            star_line = None
+            star_key = None
 
-        for line_to_fill in transitions_to_merge:
-            if line_to_fill == star_line:
+        labels = []
+        for key, sent_msgs in transitions_to_merge.items():
+            if key == star_key:
                 continue
-            sent_msgs = transitions_to_merge[line_to_fill]
+            next_state, recv_msgs_id, color = key
             sent_msgs_str = "-".join(sent_msgs)
-            # line_to_fill = "0" -> "1" [label="%s / {recv_msgs_str}"] % sent_msgs_str
-            # line_to_fill = "0" -> "1" [label="sent_msgs_str / recv_msgs_str"]
-            yield line_to_fill % sent_msgs_str
+            labels.append(((next_state, color), f"{sent_msgs_str} / {recv_msgs_strs[recv_msgs_id]}"))
 
-        if star_line:
-            # pylint: disable=consider-using-f-string
-            yield star_line % "*"
+        if star_key:
+            next_state, recv_msgs_id, color = star_key
+            labels.append(((next_state, color), f"* / {recv_msgs_strs[recv_msgs_id]}"))
+        return labels
 
     # ----------------------------------------------------------------------
 
     # 修改输入集，返回一个新的自动机
     def rename_input_vocabulary(self, mapping: Dict[str, str]):
-        new_vocabulary = set()
-        for word in self.input_vocabulary:
-            if word in mapping:
-                new_vocabulary.add(mapping[word])
-            else:
-                new_vocabulary.add(word)
-        result = Automaton(new_vocabulary)
-
-        for state, transitions in self.states.items():
-            for word in transitions:
-                if word in mapping:
-                    sent_msg = mapping[word]
-                else:
-                    sent_msg = word
-                output = transitions[word]
-                result.add_transition(state, output[0], sent_msg, output[1], output[2])
-        return result
+        return self.view().rename_input_vocabulary(mapping).materialize()
 
     # 修改输出集
     def rename_output_vocabulary(self, mapping: Dict[str, str]):
-        result = Automaton(self.input_vocabulary)
-        result.input_vocabulary = self.input_vocabulary
-        for state, transitions in self.states.items():
-            for sent_msg, output in transitions.items():
-                new_recv_msgs = []
-                for word in output[1]:
-                    if word in mapping:
-                        new_recv_msgs.append(mapping[word])
-                    else:
-                        new_recv_msgs.append(word)
-                result.add_transition(state, output[0], sent_msg, new_recv_msgs, output[2])
-        return result
+        return self.view().rename_output_vocabulary(mapping).materialize()
 
     # 合并状态 -------------------------------------------
+    # 基于Hopcroft划分细化求最小Mealy机，不可达状态会被删除
+    # 每个等价类保留编号最小的状态，初始状态0始终保留
     def minimize(self):
-        states_to_merge = self._find_states_to_merge()
-        # 不断合并
-        while states_to_merge:
-            for state_list in states_to_merge:
-                self._merge_state(state_list)
-            # 合并一轮之后不一定最小，再次查找是否有可以合并的状态
-            # 直到不能合并为止
-            states_to_merge = self._find_states_to_merge()
+        if 0 not in self.states:
+            return self
+        states = self._reachable_states()
+        state_index = {state: index for index, state in enumerate(states)}
+        successors, outputs = self._encode_transitions(states, state_index)
+
+        block_of = refine_partition(successors, outputs)
+        representatives: Dict[int, int] = {}
+        for index, state in enumerate(states):
+            representatives.setdefault(block_of[index], state)
+
+        merged_states: Dict[int, TransitionList] = {}
+        for index, state in enumerate(states):
+            if representatives[block_of[index]] != state:
+                continue
+            merged_states[state] = {
+                sent_msg: (representatives[block_of[state_index[next_state]]], recv_msgs, colors)
+                for sent_msg, (next_state, recv_msgs, colors) in self.states[state].items()
+            }
+        self.states = merged_states
+        self._invalidate_caches()
         return self
 
-    def _find_states_to_merge(self):
-        # behaviors = [key=状态表，value=可以合并的状态的集合]
-        behaviors: Dict[str, List[int]] = {}
-        for state, transitions in self.states.items():
-            behavior = str(sorted(transitions.items()))
-            # 如果有两个状态，它们的转移表相同，则可以合并
-            if behavior not in behaviors:
-                behaviors[behavior] = []
-            behaviors[behavior].append(state)
-
-        result = []
-        for same_states_list in behaviors.values():
-            if len(same_states_list) > 1:
-                result.append(same_states_list)
-        return result
-
-    def _merge_state(self, state_list):
-        # 将合并状态中的第一个状态作为合并后的状态
-        # 因为会存在下一个状态也出现在合并状态中，所以需要先修改下一个状态
-        # 之后将其他状态从状态表中删除
-        merged_state = state_list.pop(0)
-        for transitions in self.states.values():
-            for sent_msg, output in transitions.items():
-                next_state, recv_msgs, colors = output
-                if next_state in state_list:
-                    transitions[sent_msg] = merged_state, recv_msgs, colors
-        for state in state_list:
-            self.states.pop(state)
+    # 将状态转移表编码为整数矩阵，行按states排列，列按排序后的输入集排列
+    # 返回(successors, outputs)，outputs中相同的输出序列编码相同
+    def _encode_transitions(
+            self, states: List[int], state_index: Dict[int, int]
+    ) -> Tuple[List[List[int]], List[List[int]]]:
+        vocabulary = sorted(self.input_vocabulary)
+        output_ids: Dict[Tuple[str, ...], int] = {}
+        successors = []
+        outputs = []
+        for state in states:
+            transitions = self.states[state]
+            successors.append([state_index[transitions[word][0]] for word in vocabulary])
+            outputs.append([
+                output_ids.setdefault(tuple(transitions[word][1]), len(output_ids))
+                for word in vocabulary
+            ])
+        return successors, outputs
+
+    # 从初始状态出发可达的状态，按编号排序
+    def _reachable_states(self) -> List[int]:
+        visited = {0}
+        to_visit = [0]
+        while to_visit:
+            state = to_visit.pop()
+            for next_state, _, _ in self.states[state].values():
+                if next_state not in visited:
+                    visited.add(next_state)
+                    to_visit.append(next_state)
+        return sorted(visited)
 
     # ----------------------------------------------------
 
@@ -418,32 +600,75 @@ class Automaton:
         """
         Return b_dist (int), the distinguishing bound for the state machine,
         and a dictionary of state pairs/sequences leading to the bound.
-        """
-        nb_states = len(self.states)
 
-        b_dist = 0
+        The shortest separating word of every state pair is found with a
+        backward breadth-first search over the state-pair graph, and the
+        lexicographically smallest one is reported for each pair.
+        """
+        states = sorted(self.states)
+        nb_states = len(states)
+        state_index = {state: index for index, state in enumerate(states)}
+        successors, outputs = self._encode_transitions(states, state_index)
+        vocabulary = sorted(self.input_vocabulary)
+        nb_inputs = len(vocabulary)
+
+        predecessors: List[List[List[int]]] = [[[] for _ in states] for _ in range(nb_inputs)]
+        for state, row in enumerate(successors):
+            for index, next_state in enumerate(row):
+                predecessors[index][next_state].append(state)
+
+        # distances[p * nb_states + q] (p < q) 为最短区分序列的长度，0表示无法区分
+        distances = [0] * (nb_states * nb_states)
+        queue = deque()
+        for state1, state2 in combinations(range(nb_states), 2):
+            if outputs[state1] != outputs[state2]:
+                distances[state1 * nb_states + state2] = 1
+                queue.append((state1, state2))
+
+        while queue:
+            state1, state2 = queue.popleft()
+            distance = distances[state1 * nb_states + state2] + 1
+            for index in range(nb_inputs):
+                for previous1 in predecessors[index][state1]:
+                    for previous2 in predecessors[index][state2]:
+                        if previous1 == previous2:
+                            continue
+                        pair = (min(previous1, previous2), max(previous1, previous2))
+                        if not distances[pair[0] * nb_states + pair[1]]:
+                            distances[pair[0] * nb_states + pair[1]] = distance
+                            queue.append(pair)
+
+        b_dist = max(distances, default=0)
         b_pairs: Dict[str, List[str]] = {}
+        for state1, state2 in combinations(range(nb_states), 2):
+            if b_dist and distances[state1 * nb_states + state2] == b_dist:
+                key = f"({states[state1]}, {states[state2]})"
+                b_pairs[key] = self._shortest_separating_word(
+                    state1, state2, distances, successors, outputs, vocabulary
+                )
+        return b_dist, b_pairs
 
-        for pair in combinations(range(nb_states), 2):
-            break_var = False
-            for loop_index in range(1, nb_states):
-                if break_var:
+    # 沿距离递减的方向选取最小的输入，得到字典序最小的最短区分序列
+    # pylint: disable=too-many-arguments
+    @staticmethod
+    def _shortest_separating_word(state1, state2, distances, successors, outputs, vocabulary):
+        nb_states = len(successors)
+        word = []
+        distance = distances[state1 * nb_states + state2]
+        while distance > 1:
+            for index, sent_msg in enumerate(vocabulary):
+                next1, next2 = successors[state1][index], successors[state2][index]
+                pair = (min(next1, next2), max(next1, next2))
+                if next1 != next2 and distances[pair[0] * nb_states + pair[1]] == distance - 1:
+                    word.append(sent_msg)
+                    state1, state2 = pair
+                    distance -= 1
                     break
-                for word in product(sorted(self.input_vocabulary), repeat=loop_index):
-                    output_words1 = self.run(list(word), initial_state=pair[0])[1]
-                    output_words2 = self.run(list(word), initial_state=pair[1])[1]
-                    if output_words1 != output_words2:
-                        if b_dist <= loop_index:
-                            b_dist = loop_index
-                            b_pairs[f"({pair[0]}, {pair[1]})"] = list(word)
-                        break_var = True
-                        break
-
-            if break_var:
-                continue
-
-        b_pairs = {k: v for (k, v) in b_pairs.items() if len(v) == b_dist}
-        return b_dist, b_pairs
+        for index, sent_msg in enumerate(vocabulary):
+            if outputs[state1][index] != outputs[state2][index]:
+                word.append(sent_msg)
+                break
+        return word
 
 
 # 从L*算法的状态机转换成TLS状态机
@@ -485,92 +710,165 @@ def load_automaton(content: str) -> Automaton:
     return automaton
 
 
+def _is_binary_automaton_file(filename: str) -> bool:
+    with open(filename, "rb") as automaton_file:
+        return automaton_file.read(len(BINARY_AUTOMATON_MAGIC)) == BINARY_AUTOMATON_MAGIC
+
+
+# 同时支持文本格式与二进制格式(automata.binary)
 def load_automaton_from_file(filename: str) -> Automaton:
+    if _is_binary_automaton_file(filename):
+        # pylint: disable=import-outside-toplevel
+        from automata.binary import load_table_from_file
+        return load_table_from_file(filename).to_automaton()
     with open(filename, encoding="utf-8") as automaton_file:
-        content = automaton_file.read()
-    return load_automaton(content)
+        return load_automaton(automaton_file.read())
+
+
+# 加载为状态转移表(automata.table.TransitionTable)
+# 二进制格式直接使用mmap，不生成字典形式的状态机；文本格式解析后再转换
+def load_automaton_table(filename: str):
+    # pylint: disable=import-outside-toplevel
+    if _is_binary_automaton_file(filename):
+        from automata.binary import load_table_from_file
+        return load_table_from_file(filename)
+    return load_automaton_from_file(filename).to_table()
 
 
 # --------------------------------------------------------------
 
 
-# 两个状态机的所有区分序列
+# 两个状态机的区分序列
+# 在两个状态机的乘积上做BFS，每个状态对只访问一次，序列按长度从短到长返回
+# max_sequences限制返回的序列数量，None表示不限制
 def extract_distinguishes(
-        automaton1: Automaton, automaton2: Automaton
+        automaton1: Automaton, automaton2: Automaton, max_sequences: Optional[int] = None
 ) -> List[List[str]]:
     if automaton1.input_vocabulary != automaton2.input_vocabulary:
         raise DifferentInputVocabulary
 
-    vocabulary = automaton1.input_vocabulary
-    max_depth = max(len(automaton1.states), len(automaton2.states))
-    distinguishing_sequences = []
-
-    # dfs
-    def find_differences(current_sequence: List[str], state1: int, state2: int):
-        if len(current_sequence) == max_depth - 1:
-            return
+    vocabulary = sorted(automaton1.input_vocabulary)
+    distinguishing_sequences: List[List[str]] = []
+    visited = {(0, 0)}
+    to_visit = deque([(0, 0, [])])
 
+    # bfs
+    while to_visit:
+        state1, state2, current_sequence = to_visit.popleft()
         for word in vocabulary:
-            visited_sequence = current_sequence + [word]
             next_state1, recv_msgs1, _ = automaton1.states[state1][word]
             next_state2, recv_msgs2, _ = automaton2.states[state2][word]
-            if recv_msgs1 == recv_msgs2:
-                if next_state1 != state1 or next_state2 != state2:
-                    find_differences(visited_sequence, next_state1, next_state2)
-            else:
-                distinguishing_sequences.append(visited_sequence)
+            if recv_msgs1 != recv_msgs2:
+                distinguishing_sequences.append(current_sequence + [word])
+                if max_sequences is not None and len(distinguishing_sequences) >= max_sequences:
+                    return distinguishing_sequences
+            elif (next_state1, next_state2) not in visited:
+                visited.add((next_state1, next_state2))
+                to_visit.append((next_state1, next_state2, current_sequence + [word]))
 
-    find_differences([], 0, 0)
     return distinguishing_sequences
 
 
 # 多个状态机的区分序列
-def extract_pairwise_distinguishes(automatas: List[Automaton]) -> List[List[List[str]]]:
-    distinguishes = []
-    for index, automaton1 in enumerate(automatas):
-        for automaton2 in automatas[index + 1:]:
-            distinguish = extract_distinguishes(automaton1, automaton2)
-            if distinguish:
-                distinguishes.append(distinguish)
-    return distinguishes
+# workers大于1时将状态机对分片到进程池中并行计算，结果按状态机对的顺序合并
+# 状态机以文本形式序列化，每个子进程只反序列化一次
+def extract_pairwise_distinguishes(
+        automatas: List[Automaton],
+        max_sequences: Optional[int] = None,
+        workers: int = 1,
+        chunk_size: Optional[int] = None,
+) -> List[List[List[str]]]:
+    tasks = [
+        (index1, index2, max_sequences)
+        for index1, index2 in combinations(range(len(automatas)), 2)
+    ]
+    if workers <= 1 or len(tasks) <= 1:
+        results = (
+            extract_distinguishes(automatas[index1], automatas[index2], max_sequences)
+            for index1, index2, _ in tasks
+        )
+        return [distinguish for distinguish in results if distinguish]
+
+    if not chunk_size:
+        chunk_size = max(1, len(tasks) // (workers * 4))
+    serialized_automata = [str(automaton) for automaton in automatas]
+    with multiprocessing.Pool(
+            workers, _init_distinguish_worker, (serialized_automata,)
+    ) as pool:
+        return [
+            distinguish
+            for distinguish in pool.imap(_distinguish_worker, tasks, chunk_size)
+            if distinguish
+        ]
+
+
+# 子进程中反序列化后的状态机
+_worker_automata: List[Automaton] = []
+
+
+def _init_distinguish_worker(serialized_automata: List[str]):
+    global _worker_automata  # pylint: disable=global-statement
+    _worker_automata = [load_automaton(content) for content in serialized_automata]
+
+
+def _distinguish_worker(task: Tuple[int, int, Optional[int]]) -> List[List[str]]:
+    index1, index2, max_sequences = task
+    return extract_distinguishes(
+        _worker_automata[index1], _worker_automata[index2], max_sequences
+    )
 
 
 # 合并区分序列
+# 贪心集合覆盖：每次选择能区分最多剩余状态机对的序列
+# 倒排索引记录每个序列能区分的状态机对，状态机对集合用整数位图表示
 def cover_distinguishes(distinguishes: List[List[List[str]]]) -> List[List[str]]:
-    def find_next_best_sequence(distinguishes: List[List[List[str]]]) -> List[str]:
-        sequence_counts: Dict[str, int] = {}
-        max_count = 0
-        best_sequence = []
-        for distinguish in distinguishes:
-            for sequence in distinguish:
-                sequence_str = ", ".join(sequence)
-                new_count = sequence_counts.get(sequence_str, 0) + 1
-                sequence_counts[sequence_str] = new_count
-                if new_count >= max_count:
-                    best_sequence = sequence
-                    max_count = new_count
-        return best_sequence
-
-    def remove_covered_distinguishes(
-            distinguishes: List[List[List[str]]], sequence: List[str]
-    ):
-        return [
-            distinguish
-            for distinguish in distinguishes
-            if sequence not in distinguish
-        ]
+    pair_indexes: Dict[Tuple[str, ...], List[int]] = {}
+    for pair_index, distinguish in enumerate(distinguishes):
+        for sequence in distinguish:
+            pair_indexes.setdefault(tuple(sequence), []).append(pair_index)
+    covered_pairs = {
+        key: _bitset(indexes) for key, indexes in pair_indexes.items()
+    }
+
+    # 大顶堆，数量相同时优先选择先出现的序列
+    # 堆中的数量可能已经过期，取出时重新计算
+    heap = [
+        (-_popcount(pairs), order, key)
+        for order, (key, pairs) in enumerate(covered_pairs.items())
+    ]
+    heapq.heapify(heap)
+
+    remaining_pairs = 0
+    for pairs in covered_pairs.values():
+        remaining_pairs |= pairs
 
-    remaining_distinguishes = distinguishes
     distinguishing_sequences = []
-    while remaining_distinguishes:
-        next_sequence = find_next_best_sequence(remaining_distinguishes)
-        remaining_distinguishes = remove_covered_distinguishes(
-            remaining_distinguishes, next_sequence
-        )
-        distinguishing_sequences.append(next_sequence)
+    while remaining_pairs:
+        negative_count, order, key = heapq.heappop(heap)
+        newly_covered = covered_pairs[key] & remaining_pairs
+        count = _popcount(newly_covered)
+        if count != -negative_count:
+            if count:
+                heapq.heappush(heap, (-count, order, key))
+            continue
+        remaining_pairs &= ~newly_covered
+        distinguishing_sequences.append(list(key))
     return distinguishing_sequences
 
 
+def _bitset(indexes: List[int]) -> int:
+    bits = 0
+    for index in set(indexes):
+        bits |= 1 << index
+    return bits
+
+
+def _popcount(bitset: int) -> int:
+    if hasattr(bitset, "bit_count"):
+        return bitset.bit_count()
+    return bin(bitset).count("1")
+
+
 def get_outputs(
         automata: List[Automaton], sequence: List[str]
 ) -> List[List[List[str]]]:
@@ -578,13 +876,14 @@ def get_outputs(
 
 
 def fingerprint_automata(
-        automata: List[Automaton],
+        automata: List[Automaton], max_sequences: Optional[int] = None, workers: int = 1
 ) -> List[Tuple[List[str], List[List[List[str]]]]]:
-    distinguishes = extract_pairwise_distinguishes(automata)
+    distinguishes = extract_pairwise_distinguishes(automata, max_sequences, workers)
     if not distinguishes:
         raise IndistinguishableSetOfAutomata
 
     covering_sequences = cover_distinguishes(distinguishes)
-    return [
-        (sequence, get_outputs(automata, sequence)) for sequence in covering_sequences
-    ]
+    # pylint: disable=import-outside-toplevel
+    from automata.batch import get_outputs_batch
+    outputs = get_outputs_batch(automata, covering_sequences)
+    return list(zip(covering_sequences, outputs))
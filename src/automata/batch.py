@@ -0,0 +1,123 @@
+# 多个状态机、多条输入序列的批量运行
+from typing import Dict, List, Tuple
+
+import numpy
+
+from automata.automata import Automaton, DifferentInputVocabulary
+from automata.table import TransitionTable
+
+# 填充值：超出状态数的行、超出序列长度的输入与输出
+PADDING = -1
+
+
+# 多个状态机的状态转移表堆叠成张量
+# next_state与output_id的形状为[n_automata, max_states, n_inputs]
+# 输出编码在所有状态机之间共享，output_symbols[output_id]为对应的输出序列
+# 每个状态机的初始状态都在第0行
+class AutomataStack:
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            input_symbols: List[str],
+            output_symbols: List[List[str]],
+            next_state: numpy.ndarray,
+            output_id: numpy.ndarray,
+            n_states: numpy.ndarray,
+    ):
+        self.input_symbols = input_symbols
+        self.input_index = {word: column for column, word in enumerate(input_symbols)}
+        self.output_symbols = output_symbols
+        self.next_state = next_state
+        self.output_id = output_id
+        self.n_states = n_states
+
+    def __len__(self):
+        return self.next_state.shape[0]
+
+    @classmethod
+    def from_automata(cls, automata: List[Automaton]) -> "AutomataStack":
+        return cls.from_tables([automaton.to_table() for automaton in automata])
+
+    @classmethod
+    def from_tables(cls, tables: List[TransitionTable]) -> "AutomataStack":
+        input_symbols = tables[0].input_symbols if tables else []
+        max_states = max((table.n_states for table in tables), default=0)
+        shape = (len(tables), max_states, len(input_symbols))
+
+        # 填充的行转移到自身，输出为PADDING
+        next_state = numpy.broadcast_to(
+            numpy.arange(max_states, dtype=numpy.int32)[None, :, None], shape
+        ).copy()
+        output_id = numpy.full(shape, PADDING, dtype=numpy.int32)
+        n_states = numpy.zeros(len(tables), dtype=numpy.int32)
+
+        output_ids: Dict[Tuple[str, ...], int] = {}
+        output_symbols: List[List[str]] = []
+        for index, table in enumerate(tables):
+            if table.input_symbols != input_symbols:
+                raise DifferentInputVocabulary
+            # 局部输出编号到共享输出编号的映射
+            remap = numpy.empty(len(table.output_symbols), dtype=numpy.int32)
+            for local_id, output_words in enumerate(table.output_symbols):
+                key = tuple(output_words)
+                if key not in output_ids:
+                    output_ids[key] = len(output_symbols)
+                    output_symbols.append(output_words)
+                remap[local_id] = output_ids[key]
+            next_state[index, :table.n_states] = table.next_state
+            output_id[index, :table.n_states] = remap[table.output_id]
+            n_states[index] = table.n_states
+
+        return cls(input_symbols, output_symbols, next_state, output_id, n_states)
+
+    # 将输入序列编码为[n_words, max_length]的矩阵，不足的部分用PADDING填充
+    def encode_words(self, words: List[List[str]]) -> numpy.ndarray:
+        max_length = max((len(word) for word in words), default=0)
+        inputs = numpy.full((len(words), max_length), PADDING, dtype=numpy.int32)
+        for index, word in enumerate(words):
+            inputs[index, :len(word)] = [self.input_index[msg] for msg in word]
+        return inputs
+
+    # 所有状态机同步运行所有输入序列
+    # 返回形状为[n_automata, n_words, max_length]的输出编号矩阵，以及最终所在的行号
+    def run_ids(self, inputs: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        n_words, max_length = inputs.shape
+        automaton_index = numpy.arange(len(self))[:, None]
+        rows = numpy.zeros((len(self), n_words), dtype=numpy.int32)
+        outputs = numpy.full((len(self), n_words, max_length), PADDING, dtype=numpy.int32)
+        for step in range(max_length):
+            columns = inputs[:, step]
+            valid = columns != PADDING
+            columns = numpy.where(valid, columns, 0)
+            outputs[:, :, step] = numpy.where(
+                valid, self.output_id[automaton_index, rows, columns], PADDING
+            )
+            rows = numpy.where(valid, self.next_state[automaton_index, rows, columns], rows)
+        return outputs, rows
+
+    def run(self, words: List[List[str]]) -> numpy.ndarray:
+        return self.run_ids(self.encode_words(words))[0]
+
+    # 将输出编号还原为输出序列，结果为[automaton][word][step]
+    def decode_outputs(
+            self, outputs: numpy.ndarray, words: List[List[str]]
+    ) -> List[List[List[List[str]]]]:
+        return [
+            [
+                [self.output_symbols[output_id] for output_id in row[:len(word)]]
+                for row, word in zip(automaton_outputs, words)
+            ]
+            for automaton_outputs in outputs.tolist()
+        ]
+
+
+# 与get_outputs相同，但一次计算所有序列，结果为[sequence][automaton]
+def get_outputs_batch(
+        automata: List[Automaton], sequences: List[List[str]]
+) -> List[List[List[List[str]]]]:
+    stack = AutomataStack.from_automata(automata)
+    decoded = stack.decode_outputs(stack.run(sequences), sequences)
+    return [
+        [decoded[automaton_index][sequence_index] for automaton_index in range(len(automata))]
+        for sequence_index in range(len(sequences))
+    ]
@@ -0,0 +1,116 @@
+# 状态机的二进制存储格式
+# 文本格式(.automaton)仍然是交换格式，二进制格式用于快速加载大量状态机
+#
+# 文件结构(小端序)：
+#   magic(BINARY_AUTOMATON_MAGIC) | version(u32) | n_states(u32) | n_inputs(u32) | n_outputs(u32)
+#   输入符号表：每个符号为 长度(u32) + utf-8字节
+#   输出符号表：每个输出序列为 消息数量(u32) + 每条消息的 长度(u32) + utf-8字节
+#   填充到4字节对齐
+#   states(i32[n_states]) | next_state(i32[n_states * n_inputs]) | output_id(i32[n_states * n_inputs])
+import mmap
+import struct
+from typing import List, Tuple
+
+import numpy
+
+from automata.automata import BINARY_AUTOMATON_MAGIC, load_automaton_from_file
+from automata.table import TransitionTable
+
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4I")
+_LENGTH = struct.Struct("<I")
+
+
+class InvalidBinaryAutomaton(BaseException):
+    pass
+
+
+def _pack_string(string: str) -> bytes:
+    data = string.encode("utf-8")
+    return _LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(buffer, offset: int) -> Tuple[str, int]:
+    (length,) = _LENGTH.unpack_from(buffer, offset)
+    offset += _LENGTH.size
+    return bytes(buffer[offset:offset + length]).decode("utf-8"), offset + length
+
+
+def dump_table(table: TransitionTable, filename: str):
+    chunks = [
+        BINARY_AUTOMATON_MAGIC,
+        _HEADER.pack(
+            FORMAT_VERSION, table.n_states, table.n_inputs, len(table.output_symbols)
+        ),
+    ]
+    chunks.extend(_pack_string(word) for word in table.input_symbols)
+    for output_words in table.output_symbols:
+        chunks.append(_LENGTH.pack(len(output_words)))
+        chunks.extend(_pack_string(word) for word in output_words)
+    size = sum(len(chunk) for chunk in chunks)
+    chunks.append(b"\x00" * (-size % 4))
+
+    arrays = [
+        numpy.asarray(table.states, dtype="<i4"),
+        numpy.ascontiguousarray(table.next_state, dtype="<i4"),
+        numpy.ascontiguousarray(table.output_id, dtype="<i4"),
+    ]
+    with open(filename, "wb") as automaton_file:
+        for chunk in chunks:
+            automaton_file.write(chunk)
+        for array in arrays:
+            automaton_file.write(array.tobytes())
+
+
+# 使用mmap加载，next_state与output_id直接引用映射的内存，不做复制
+def load_table_from_file(filename: str) -> TransitionTable:
+    with open(filename, "rb") as automaton_file:
+        buffer = mmap.mmap(automaton_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(BINARY_AUTOMATON_MAGIC)] != BINARY_AUTOMATON_MAGIC:
+        raise InvalidBinaryAutomaton(filename)
+    offset = len(BINARY_AUTOMATON_MAGIC)
+    version, n_states, n_inputs, n_outputs = _HEADER.unpack_from(buffer, offset)
+    if version != FORMAT_VERSION:
+        raise InvalidBinaryAutomaton(filename, version)
+    offset += _HEADER.size
+
+    input_symbols = []
+    for _ in range(n_inputs):
+        word, offset = _unpack_string(buffer, offset)
+        input_symbols.append(word)
+    output_symbols: List[List[str]] = []
+    for _ in range(n_outputs):
+        (count,) = _LENGTH.unpack_from(buffer, offset)
+        offset += _LENGTH.size
+        output_words = []
+        for _ in range(count):
+            word, offset = _unpack_string(buffer, offset)
+            output_words.append(word)
+        output_symbols.append(output_words)
+    offset += -offset % 4
+
+    states = numpy.frombuffer(buffer, dtype="<i4", count=n_states, offset=offset)
+    offset += states.nbytes
+    shape = (n_states, n_inputs)
+    next_state = numpy.frombuffer(
+        buffer, dtype="<i4", count=n_states * n_inputs, offset=offset
+    ).reshape(shape)
+    offset += next_state.nbytes
+    output_id = numpy.frombuffer(
+        buffer, dtype="<i4", count=n_states * n_inputs, offset=offset
+    ).reshape(shape)
+
+    return TransitionTable(states.tolist(), input_symbols, output_symbols, next_state, output_id)
+
+
+# 文本格式与二进制格式之间的转换
+def convert_text_to_binary(text_filename: str, binary_filename: str):
+    dump_table(load_automaton_from_file(text_filename).to_table(), binary_filename)
+
+
+def convert_binary_to_text(binary_filename: str, text_filename: str):
+    automaton = load_table_from_file(binary_filename).to_automaton()
+    with open(text_filename, "w", encoding="utf-8") as automaton_file:
+        automaton_file.write(f"{automaton}\n")
@@ -0,0 +1,150 @@
+# 状态机语料库：一个TLS版本的所有状态机保存为一个张量
+# 目录结构与identify.util相同：root/implementation/version/protocol/final.automaton
+# 行为相同(哈希值相同)的状态机只保存一次，models[i]对应的实现版本保存在implementations[i]中
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy
+
+from automata.automata import Automaton, load_automaton_table
+from automata.batch import PADDING, AutomataStack
+from automata.table import TransitionTable
+
+# (implementation, client_version)
+Implementation = Tuple[str, str]
+
+UNKNOWN_OUTPUT = -2
+
+
+class Corpus(AutomataStack):
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            input_symbols: List[str],
+            output_symbols: List[List[str]],
+            next_state: numpy.ndarray,
+            output_id: numpy.ndarray,
+            n_states: numpy.ndarray,
+            models: List[str],
+            implementations: List[List[Implementation]],
+    ):
+        super().__init__(input_symbols, output_symbols, next_state, output_id, n_states)
+        self.models = models
+        self.model_index = {model: index for index, model in enumerate(models)}
+        self.implementations = implementations
+
+    # automata中的每个状态机对应一组实现版本
+    @classmethod
+    def from_automata_with_implementations(
+            cls, automata: List[Tuple[Automaton, Implementation]]
+    ) -> "Corpus":
+        return cls.from_tables_with_implementations(
+            [(automaton.to_table(), implementation) for automaton, implementation in automata]
+        )
+
+    # 状态机按哈希值去重，名称为model-1, model-2, ...，按每个哈希值在输入中第一次出现的顺序编号
+    # (from_directory中为路径排序后的顺序)。identify的dedup命令按dot文本去重、按iterdir的顺序编号，
+    # 两者的名称不一定对应同一个状态机
+    @classmethod
+    def from_tables_with_implementations(
+            cls, tables_with_implementations: List[Tuple[TransitionTable, Implementation]]
+    ) -> "Corpus":
+        tables: Dict[bytes, TransitionTable] = {}
+        implementations: Dict[bytes, List[Implementation]] = defaultdict(list)
+        for table, implementation in tables_with_implementations:
+            automaton_hash = table.compute_hash()
+            if automaton_hash not in tables:
+                tables[automaton_hash] = table
+            implementations[automaton_hash].append(implementation)
+
+        stack = AutomataStack.from_tables(list(tables.values()))
+        models = [f"model-{index + 1}" for index in range(len(tables))]
+        return cls(
+            stack.input_symbols,
+            stack.output_symbols,
+            stack.next_state,
+            stack.output_id,
+            stack.n_states,
+            models,
+            [sorted(implementations[automaton_hash]) for automaton_hash in tables],
+        )
+
+    # 读取目录中某个协议版本(如tls12)的所有状态机
+    # 二进制格式的状态机直接通过mmap读取，不生成字典形式的状态机
+    @classmethod
+    def from_directory(
+            cls, directory: str, protocol: str, filename: str = "final.automaton"
+    ) -> "Corpus":
+        tables = []
+        for automaton_path in sorted(Path(directory).glob(f"*/*/{protocol}/{filename}")):
+            version_path = automaton_path.parent.parent
+            implementation = (version_path.parent.name, version_path.name)
+            tables.append((load_automaton_table(str(automaton_path)), implementation))
+        return cls.from_tables_with_implementations(tables)
+
+    # 保存为一个未压缩的.npz文件，符号表与实现版本以JSON字符串保存
+    def save(self, filename: str):
+        numpy.savez(
+            filename,
+            next_state=self.next_state,
+            output_id=self.output_id,
+            n_states=self.n_states,
+            input_symbols=numpy.array(json.dumps(self.input_symbols)),
+            output_symbols=numpy.array(json.dumps(self.output_symbols)),
+            models=numpy.array(json.dumps(self.models)),
+            implementations=numpy.array(json.dumps(self.implementations)),
+        )
+
+    @classmethod
+    def load(cls, filename: str) -> "Corpus":
+        with numpy.load(filename) as data:
+            return cls(
+                json.loads(data["input_symbols"].item()),
+                json.loads(data["output_symbols"].item()),
+                data["next_state"],
+                data["output_id"],
+                data["n_states"],
+                json.loads(data["models"].item()),
+                [
+                    [tuple(implementation) for implementation in implementations]
+                    for implementations in json.loads(data["implementations"].item())
+                ],
+            )
+
+    def automaton(self, model: str) -> Automaton:
+        index = self.model_index[model]
+        n_states = int(self.n_states[index])
+        return TransitionTable(
+            list(range(n_states)),
+            self.input_symbols,
+            self.output_symbols,
+            self.next_state[index, :n_states],
+            self.output_id[index, :n_states],
+        ).to_automaton()
+
+    # 对words的输出与observed_outputs([word][step])一致的状态机
+    def consistent_models(
+            self, words: List[List[str]], observed_outputs: List[List[List[str]]]
+    ) -> List[str]:
+        inputs = self.encode_words(words)
+        outputs, _ = self.run_ids(inputs)
+        output_index = {
+            tuple(output_words): index for index, output_words in enumerate(self.output_symbols)
+        }
+        # 未出现过的输出编码为UNKNOWN_OUTPUT，不与任何状态机匹配
+        expected = numpy.full(inputs.shape, UNKNOWN_OUTPUT, dtype=numpy.int32)
+        for word_index, word_outputs in enumerate(observed_outputs):
+            for step, output_words in enumerate(word_outputs):
+                expected[word_index, step] = output_index.get(tuple(output_words), UNKNOWN_OUTPUT)
+        valid = inputs != PADDING
+        matches = ((outputs == expected[None]) | ~valid[None]).all(axis=(1, 2))
+        return [self.models[index] for index in numpy.flatnonzero(matches)]
+
+    # 所有状态机两两之间是否能被words区分，结果为[n_models, n_models]的布尔矩阵
+    def distinguished_pairs(self, words: List[List[str]]) -> numpy.ndarray:
+        outputs, _ = self.run_ids(self.encode_words(words))
+        _, classes = numpy.unique(outputs.reshape(len(self), -1), axis=0, return_inverse=True)
+        classes = classes.reshape(-1)
+        return classes[:, None] != classes[None, :]
@@ -0,0 +1,157 @@
+# 多个状态机共享状态的存储
+# 所有加入的状态机的状态放在同一个最小化的状态集合中，行为相同的状态只保存一次，
+# 每个状态机只是指向其初始状态的一个编号
+# 状态机中存在环，无法自底向上逐个状态计算哈希，因此每次加入状态机时，先用refine_partition
+# 将其单独最小化，再按输出行查找候选的已有节点，沿转移检查候选节点与等价类的行为是否相同
+# 加入一个状态机的开销只与该状态机的规模有关，与已有节点的数量无关
+from collections import deque
+from typing import Dict, List, Set, Tuple
+
+from automata.automata import Automaton, DifferentInputVocabulary, refine_partition
+
+
+class StateStore:
+    def __init__(self, input_vocabulary):
+        self.input_symbols = sorted(input_vocabulary)
+        self.input_index = {word: column for column, word in enumerate(self.input_symbols)}
+        self.output_symbols: List[List[str]] = []
+        self.output_ids: Dict[Tuple[str, ...], int] = {}
+        # successors[node][i]为节点收到第i个输入后的节点，outputs[node][i]为输出编号
+        # 节点之间两两不等价，节点编号在加入新的状态机后保持不变
+        self.successors: List[List[int]] = []
+        self.outputs: List[List[int]] = []
+        # 状态机名称 -> 初始状态对应的节点
+        self.roots: Dict[str, int] = {}
+        # 输出行 -> 输出行相同的节点，用于查找候选节点
+        self.nodes_by_outputs: Dict[Tuple[int, ...], List[int]] = {}
+
+    def __len__(self):
+        return len(self.successors)
+
+    def _output_id(self, output_words: List[str]) -> int:
+        key = tuple(output_words)
+        if key not in self.output_ids:
+            self.output_ids[key] = len(self.output_symbols)
+            self.output_symbols.append(list(output_words))
+        return self.output_ids[key]
+
+    # 加入一个状态机，返回其初始状态对应的节点
+    # 只保存从初始状态可达的状态，原状态机不会被修改
+    def add(self, model: str, automaton: Automaton) -> int:
+        if sorted(automaton.input_vocabulary) != self.input_symbols:
+            raise DifferentInputVocabulary
+
+        # 单独最小化新的状态机，每个等价类用第一个出现的状态代表
+        states = automaton._reachable_states()  # pylint: disable=protected-access
+        state_index = {state: index for index, state in enumerate(states)}
+        successors = [
+            [state_index[automaton.states[state][word][0]] for word in self.input_symbols]
+            for state in states
+        ]
+        outputs = [
+            [self._output_id(automaton.states[state][word][1]) for word in self.input_symbols]
+            for state in states
+        ]
+        block_of = refine_partition(successors, outputs)
+        representatives: Dict[int, int] = {}
+        for index, block in enumerate(block_of):
+            representatives.setdefault(block, index)
+        block_successors = {
+            block: [block_of[next_index] for next_index in successors[index]]
+            for block, index in representatives.items()
+        }
+        block_outputs = {block: outputs[index] for block, index in representatives.items()}
+
+        # 与已有节点匹配，没有匹配的等价类成为新节点
+        node_of_block: Dict[int, int] = {}
+        unmatched: Set[int] = set()
+        for block in representatives:
+            if block not in node_of_block:
+                self._match(block, block_successors, block_outputs, node_of_block, unmatched)
+        new_blocks = []
+        for block in representatives:
+            if block not in node_of_block:
+                node_of_block[block] = len(self.successors) + len(new_blocks)
+                new_blocks.append(block)
+        for block in new_blocks:
+            node = node_of_block[block]
+            self.successors.append(
+                [node_of_block[next_block] for next_block in block_successors[block]]
+            )
+            self.outputs.append(block_outputs[block])
+            self.nodes_by_outputs.setdefault(tuple(block_outputs[block]), []).append(node)
+
+        root = node_of_block[block_of[0]]
+        self.roots[model] = root
+        return root
+
+    # 在输出行相同的候选节点中查找与block行为相同的节点，找到后记录block及其后继的对应节点
+    # pylint: disable=too-many-arguments
+    def _match(self, block, block_successors, block_outputs, node_of_block, unmatched):
+        for node in self.nodes_by_outputs.get(tuple(block_outputs[block]), []):
+            mapping = self._embed(
+                block, node, block_successors, block_outputs, node_of_block, unmatched
+            )
+            if mapping is not None:
+                node_of_block.update(mapping)
+                return
+        unmatched.add(block)
+
+    # 从(block, node)出发同时沿转移前进，检查每一步的输出是否相同
+    # 新状态机已经最小化，已有节点两两不等价，因此行为相同时block到节点的对应关系是唯一的，
+    # 对应关系冲突(或到达已知没有对应节点的block)即说明两者不等价
+    # pylint: disable=too-many-arguments
+    def _embed(self, block, node, block_successors, block_outputs, node_of_block, unmatched):
+        mapping = {block: node}
+        to_visit = [block]
+        while to_visit:
+            current_block = to_visit.pop()
+            current_node = mapping[current_block]
+            if self.outputs[current_node] != block_outputs[current_block]:
+                return None
+            for next_block, next_node in zip(
+                    block_successors[current_block], self.successors[current_node]
+            ):
+                known_node = node_of_block.get(next_block, mapping.get(next_block))
+                if known_node is None:
+                    if next_block in unmatched:
+                        return None
+                    mapping[next_block] = next_node
+                    to_visit.append(next_block)
+                elif known_node != next_node:
+                    return None
+        return mapping
+
+    # 两个状态机行为是否相同
+    def same_behaviour(self, model1: str, model2: str) -> bool:
+        return self.roots[model1] == self.roots[model2]
+
+    # 状态机收到msg_sequence之后所在的节点
+    # 两个状态机在各自的输入序列之后行为相同，当且仅当返回的节点相同
+    def node_after(self, model: str, msg_sequence: List[str]) -> int:
+        node = self.roots[model]
+        for msg in msg_sequence:
+            node = self.successors[node][self.input_index[msg]]
+        return node
+
+    # 从节点出发可达的子状态机，节点按BFS顺序重新编号，初始状态为0
+    def automaton(self, model: str) -> Automaton:
+        root = self.roots[model]
+        state_mapping = {root: 0}
+        to_visit = deque([root])
+        while to_visit:
+            node = to_visit.popleft()
+            for next_node in self.successors[node]:
+                if next_node not in state_mapping:
+                    state_mapping[next_node] = len(state_mapping)
+                    to_visit.append(next_node)
+
+        automaton = Automaton(set(self.input_symbols))
+        for node, state in state_mapping.items():
+            automaton.states[state] = {
+                word: (state_mapping[next_node], list(self.output_symbols[output_id]), set())
+                for word, next_node, output_id in zip(
+                    self.input_symbols, self.successors[node], self.outputs[node]
+                )
+            }
+        return automaton
@@ -0,0 +1,78 @@
+# 基于乘积自动机的性质检查
+# 监控自动机描述一个安全性质，它与状态机做乘积后用BFS判断违反性质的转移是否可达，
+# 复杂度与状态机的规模成线性关系
+import abc
+from collections import deque
+from typing import Dict, List, Tuple
+
+from automata.automata import Automaton, Path
+
+
+# 监控自动机，读入状态机的每一条转移(sent_msg, recv_msgs)
+class Monitor(abc.ABC):
+    initial_state = 0
+
+    @abc.abstractmethod
+    def next_state(self, state: int, sent_msg: str, recv_msgs: List[str]) -> int:
+        pass
+
+    # 该转移是否违反性质，违反性质的转移之后不再继续搜索
+    @abc.abstractmethod
+    def is_violation(self, state: int, sent_msg: str, recv_msgs: List[str]) -> bool:
+        pass
+
+
+# 性质：在发送required_msg之前不应收到recv_msg
+# 状态0表示required_msg尚未发送，状态1表示已经发送
+class ReceivedWithoutSent(Monitor):
+    def __init__(self, recv_msg: str, required_msg: str):
+        self.recv_msg = recv_msg
+        self.required_msg = required_msg
+
+    def next_state(self, state, sent_msg, recv_msgs):
+        if state == 1 or sent_msg == self.required_msg:
+            return 1
+        return 0
+
+    def is_violation(self, state, sent_msg, recv_msgs):
+        return state == 0 and sent_msg != self.required_msg and self.recv_msg in recv_msgs
+
+
+# 在状态机与监控自动机的乘积上做BFS
+# 对每一条可达的违反性质的转移，返回一条从初始状态出发的最短路径作为证据，可直接用于color_path
+def find_violations(automaton: Automaton, monitor: Monitor) -> List[Path]:
+    vocabulary = sorted(automaton.input_vocabulary)
+    initial = (0, monitor.initial_state)
+    # 乘积状态 -> (前一个乘积状态, 发送的消息)
+    parents: Dict[Tuple[int, int], Tuple[Tuple[int, int], str]] = {}
+    visited = {initial}
+    to_visit = deque([initial])
+    witnesses: List[Path] = []
+    violating_transitions = set()
+
+    while to_visit:
+        product_state = to_visit.popleft()
+        state, monitor_state = product_state
+        for sent_msg in vocabulary:
+            next_state, recv_msgs, _ = automaton.follow_transition(state, sent_msg)
+            if monitor.is_violation(monitor_state, sent_msg, recv_msgs):
+                if (state, sent_msg) not in violating_transitions:
+                    violating_transitions.add((state, sent_msg))
+                    witnesses.append(_witness_path(parents, product_state) + [(state, sent_msg)])
+                continue
+            next_product_state = (next_state, monitor.next_state(monitor_state, sent_msg, recv_msgs))
+            if next_product_state not in visited:
+                visited.add(next_product_state)
+                parents[next_product_state] = (product_state, sent_msg)
+                to_visit.append(next_product_state)
+
+    return witnesses
+
+
+def _witness_path(parents, product_state) -> Path:
+    path: Path = []
+    while product_state in parents:
+        product_state, sent_msg = parents[product_state]
+        path.append((product_state[0], sent_msg))
+    path.reverse()
+    return path
@@ -0,0 +1,54 @@
+# 已知状态机的索引
+# 目标的响应与状态树中的所有路径都不匹配时(例如未发布的版本)，返回与观察到的响应序列最接近的已知状态机
+# 识别时只观察到一条响应序列，直接与每个状态机比较，开销为状态机数量乘以序列长度
+# 每个状态机只保存转移表：状态 -> 发送的消息 -> (下一个状态, "+"连接的输出)
+from typing import Dict, List, Optional, Set, Tuple
+
+from automata.automata import Automaton
+
+Transitions = Dict[int, Dict[str, Tuple[int, str]]]
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self.transitions: Dict[str, Transitions] = {}
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def add(self, model: str, automaton: Automaton):
+        self.transitions[model] = {
+            state: {
+                sent_msg: (next_state, "+".join(output_words))
+                for sent_msg, (next_state, output_words, _) in transitions.items()
+            }
+            for state, transitions in automaton.states.items()
+        }
+
+    # trace为从初始状态开始观察到的[(sent_msg, recv_msg)]，recv_msg为"+"连接的输出
+    # 距离为状态机的输出与trace不同的步数比例，状态机中没有定义的转移之后的步骤都算作不同
+    # models限制参与比较的状态机，例如识别过程中尚未被删除的状态机
+    # 结果为[(model, distance)]，按距离从小到大排列
+    def query_trace(
+            self,
+            trace: List[Tuple[str, str]],
+            k: int = 5,
+            models: Optional[Set[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        results = []
+        for model, transitions in self.transitions.items():
+            if models is not None and model not in models:
+                continue
+            state = 0
+            differing = 0
+            for step, (sent_msg, recv_msg) in enumerate(trace):
+                transition = transitions[state].get(sent_msg)
+                if transition is None:
+                    differing += len(trace) - step
+                    break
+                state, output = transition
+                if output != recv_msg:
+                    differing += 1
+            results.append((model, differing / len(trace) if trace else 0.0))
+        results.sort(key=lambda result: (result[1], result[0]))
+        return results[:k]
@@ -0,0 +1,169 @@
+# 整数编码、基于数组的状态转移表
+# 用于批量运算(AutomataStack、Corpus、二进制格式、漏洞检测)
+# 逐条消息运行时Python中字典访问更快，Automaton.run、follow_transition与dot输出仍使用字典形式
+# compute_hash与Automaton.compute_hash结果相同，只需要哈希值时不必生成字典形式的状态机
+import hashlib
+import struct
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy
+
+from automata.automata import Automaton, _hash_strings
+
+
+# 状态转移表
+# 输入、输出都编码为整数，next_state与output_id是形状为[n_states, n_inputs]的矩阵
+# 行号对应states中的状态，列号对应input_symbols中的输入
+# 颜色只保存非空的转移，key为(行号, 列号)，转换时复制颜色集合，之后对状态机的着色不会影响该表
+class TransitionTable:
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            states: List[int],
+            input_symbols: List[str],
+            output_symbols: List[List[str]],
+            next_state: numpy.ndarray,
+            output_id: numpy.ndarray,
+            colors: Optional[Dict[Tuple[int, int], Set[str]]] = None,
+    ):
+        self.states = states
+        self.state_index = {state: row for row, state in enumerate(states)}
+        self.input_symbols = input_symbols
+        self.input_index = {word: column for column, word in enumerate(input_symbols)}
+        self.output_symbols = output_symbols
+        self.next_state = next_state
+        self.output_id = output_id
+        self.colors = colors if colors is not None else {}
+        # 逐条消息运行时使用的列表形式，按需生成
+        self._next_rows: Optional[List[List[int]]] = None
+        self._output_rows: Optional[List[List[int]]] = None
+
+    @property
+    def n_states(self) -> int:
+        return len(self.states)
+
+    @property
+    def n_inputs(self) -> int:
+        return len(self.input_symbols)
+
+    # 从字典形式的状态机转换
+    @classmethod
+    def from_automaton(cls, automaton: Automaton) -> "TransitionTable":
+        states = sorted(automaton.states)
+        state_index = {state: row for row, state in enumerate(states)}
+        input_symbols = sorted(automaton.input_vocabulary)
+
+        output_ids: Dict[Tuple[str, ...], int] = {}
+        output_symbols: List[List[str]] = []
+        next_state = numpy.zeros((len(states), len(input_symbols)), dtype=numpy.int32)
+        output_id = numpy.zeros((len(states), len(input_symbols)), dtype=numpy.int32)
+        colors: Dict[Tuple[int, int], Set[str]] = {}
+        for row, state in enumerate(states):
+            transitions = automaton.states[state]
+            for column, word in enumerate(input_symbols):
+                output_state, output_words, transition_colors = transitions[word]
+                key = tuple(output_words)
+                if key not in output_ids:
+                    output_ids[key] = len(output_symbols)
+                    output_symbols.append(list(output_words))
+                next_state[row, column] = state_index[output_state]
+                output_id[row, column] = output_ids[key]
+                if transition_colors:
+                    colors[(row, column)] = set(transition_colors)
+
+        return cls(states, input_symbols, output_symbols, next_state, output_id, colors)
+
+    # 转换回字典形式的状态机
+    def to_automaton(self) -> Automaton:
+        next_rows, output_rows = self._rows()
+        automaton = Automaton(set(self.input_symbols))
+        for row, state in enumerate(self.states):
+            automaton.add_state(state)
+            for column, word in enumerate(self.input_symbols):
+                automaton.states[state][word] = (
+                    self.states[next_rows[row][column]],
+                    list(self.output_symbols[output_rows[row][column]]),
+                    set(self.colors.get((row, column), ())),
+                )
+        return automaton
+
+    def _rows(self) -> Tuple[List[List[int]], List[List[int]]]:
+        if self._next_rows is None:
+            self._next_rows = self.next_state.tolist()
+            self._output_rows = self.output_id.tolist()
+        return self._next_rows, self._output_rows
+
+    # 整数形式的运行，返回最终所在行号以及输出编号序列
+    def run_ids(self, input_ids: List[int], initial_row=0) -> Tuple[int, List[int]]:
+        next_rows, output_rows = self._rows()
+        row = initial_row
+        output = []
+        for column in input_ids:
+            output.append(output_rows[row][column])
+            row = next_rows[row][column]
+        return row, output
+
+    # 与Automaton.follow_transition相同，返回[output_state, output_words, colors]
+    def follow_transition(self, state: int, msg: str):
+        next_rows, output_rows = self._rows()
+        row = self.state_index[state]
+        column = self.input_index[msg]
+        return (
+            self.states[next_rows[row][column]],
+            self.output_symbols[output_rows[row][column]],
+            self.colors.get((row, column), set()),
+        )
+
+    # 与Automaton.run相同
+    def run(self, msg_sequence: List[str], initial_state=0) -> Tuple[int, List[List[str]]]:
+        row, output = self.run_ids(
+            [self.input_index[msg] for msg in msg_sequence], self.state_index[initial_state]
+        )
+        return self.states[row], [self.output_symbols[output_id] for output_id in output]
+
+    # 与Automaton.compute_hash相同的哈希值，直接在整数数组上计算
+    # 要求input_symbols已排序(from_automaton与二进制格式都满足)
+    def compute_hash(self) -> bytes:
+        next_rows, output_rows = self._rows()
+
+        # 与Automaton.browse_automaton_and_build_mapping相同的状态顺序，sink状态排在最后
+        def is_sink(row):
+            return all(next_row == row for next_row in next_rows[row])
+
+        initial_row = self.state_index[0]
+        rows_to_visit = deque([initial_row])
+        sink_rows: List[int] = []
+        processed_rows = {initial_row}
+        row_order: List[int] = []
+        while rows_to_visit:
+            row = rows_to_visit.popleft()
+            row_order.append(row)
+            for next_row in next_rows[row]:
+                if next_row in processed_rows:
+                    continue
+                processed_rows.add(next_row)
+                if is_sink(next_row):
+                    sink_rows.append(next_row)
+                else:
+                    rows_to_visit.append(next_row)
+        row_order.extend(sink_rows)
+        row_mapping = {row: index for index, row in enumerate(row_order)}
+
+        digest = hashlib.md5()
+        _hash_strings(digest, self.input_symbols)
+        output_ids: Dict[int, int] = {}
+        for row in row_order:
+            hashed_row = []
+            new_outputs = []
+            for next_row, output_id in zip(next_rows[row], output_rows[row]):
+                if output_id not in output_ids:
+                    output_ids[output_id] = len(output_ids)
+                    new_outputs.append(output_id)
+                hashed_row.append(row_mapping[next_row])
+                hashed_row.append(output_ids[output_id])
+            digest.update(struct.pack(f"<{len(hashed_row)}i", *hashed_row))
+            digest.update(struct.pack("<i", len(new_outputs)))
+            for output_id in new_outputs:
+                _hash_strings(digest, self.output_symbols[output_id])
+        return digest.digest()
@@ -0,0 +1,126 @@
+# 状态机的只读视图
+# 重命名输入/输出集、删除输入消息时不复制状态转移，只记录映射与删除的输入，
+# 查询时再通过映射访问原状态机，需要时用materialize生成新的状态机
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from automata.automata import Automaton, MultipleDefinitionForATransition
+
+
+# 在已有的映射之后再应用mapping，映射的键始终是原状态机中的消息
+def _compose_mapping(mapping: Dict[str, str], new_mapping: Dict[str, str]) -> Dict[str, str]:
+    result = {word: new_mapping.get(name, name) for word, name in mapping.items()}
+    for word, name in new_mapping.items():
+        if word not in mapping:
+            result[word] = name
+    return result
+
+
+class AutomatonView:
+    def __init__(
+            self,
+            base: Automaton,
+            input_mapping: Optional[Dict[str, str]] = None,
+            output_mapping: Optional[Dict[str, str]] = None,
+            removed_inputs: FrozenSet[str] = frozenset(),
+    ):
+        self.base = base
+        # 原输入消息 -> 新输入消息，不在映射中的消息保持不变
+        self.input_mapping = input_mapping or {}
+        # 原输出消息 -> 新输出消息
+        self.output_mapping = output_mapping or {}
+        # 被删除的原输入消息
+        self.removed_inputs = removed_inputs
+        # 新输入消息 -> 原输入消息，第一次查询时生成
+        self._base_inputs: Optional[Dict[str, str]] = None
+
+    def _input_name(self, word: str) -> str:
+        return self.input_mapping.get(word, word)
+
+    @property
+    def input_vocabulary(self) -> Set[str]:
+        return {
+            self._input_name(word)
+            for word in self.base.input_vocabulary
+            if word not in self.removed_inputs
+        }
+
+    def rename_input_vocabulary(self, mapping: Dict[str, str]) -> "AutomatonView":
+        return AutomatonView(
+            self.base,
+            _compose_mapping(self.input_mapping, mapping),
+            self.output_mapping,
+            self.removed_inputs,
+        )
+
+    def rename_output_vocabulary(self, mapping: Dict[str, str]) -> "AutomatonView":
+        return AutomatonView(
+            self.base,
+            self.input_mapping,
+            _compose_mapping(self.output_mapping, mapping),
+            self.removed_inputs,
+        )
+
+    # 删除后的状态编号仍与原状态机相同，materialize时才重新排序
+    def remove_input_word(self, word_to_remove: str) -> "AutomatonView":
+        removed = {
+            word
+            for word in self.base.input_vocabulary
+            if word not in self.removed_inputs and self._input_name(word) == word_to_remove
+        }
+        if not removed:
+            raise KeyError(word_to_remove)
+        return AutomatonView(
+            self.base,
+            self.input_mapping,
+            self.output_mapping,
+            self.removed_inputs | removed,
+        )
+
+    def _rename_outputs(self, output_words: List[str]) -> List[str]:
+        if not self.output_mapping:
+            return output_words
+        return [self.output_mapping.get(word, word) for word in output_words]
+
+    def _base_input(self, msg: str) -> str:
+        if self._base_inputs is None:
+            base_inputs = {}
+            for word in self.base.input_vocabulary:
+                if word in self.removed_inputs:
+                    continue
+                name = self._input_name(word)
+                if name in base_inputs:
+                    raise MultipleDefinitionForATransition(name)
+                base_inputs[name] = word
+            self._base_inputs = base_inputs
+        return self._base_inputs[msg]
+
+    # [output_state, output_words, colors]
+    def follow_transition(self, state: int, msg: str) -> Tuple[int, List[str], Set[str]]:
+        output_state, output_words, colors = self.base.states[state][self._base_input(msg)]
+        return output_state, self._rename_outputs(output_words), colors
+
+    def run(self, msg_sequence: List[str], initial_state=0) -> Tuple[int, List[List[str]]]:
+        current_state = initial_state
+        output = []
+        for msg in msg_sequence:
+            current_state, output_words, _ = self.follow_transition(current_state, msg)
+            output.append(output_words)
+        return current_state, output
+
+    # 生成新的状态机，颜色集合会被复制，新状态机的修改不影响原状态机
+    # 两条输入消息被映射为同一条消息时抛出MultipleDefinitionForATransition
+    def materialize(self) -> Automaton:
+        result = Automaton(self.input_vocabulary)
+        for state, transitions in self.base.states.items():
+            new_transitions = {}
+            for word, (output_state, output_words, colors) in transitions.items():
+                if word in self.removed_inputs:
+                    continue
+                name = self._input_name(word)
+                if name in new_transitions:
+                    raise MultipleDefinitionForATransition(state, name)
+                new_transitions[name] = (output_state, self._rename_outputs(output_words), set(colors))
+            result.states[state] = new_transitions
+        if self.removed_inputs:
+            return result.reorder_states()
+        return result
@@ -1,26 +1,37 @@
+# 某个状态下，只要有一条good消息与某条bad消息的(下一个状态, 输出)不同，该状态就是oracle状态
+# 比较不考虑转移的颜色
 def find_bb_oracle(automaton, good_msgs, bad_msgs):
-    interesting_states = []
-
-    for state in automaton.states:
-        for good_msg in good_msgs:
-            server_answer = automaton.follow_transition(state, good_msg)
-            for bad_msg in bad_msgs:
-                if automaton.follow_transition(state, bad_msg) != server_answer:
-                    interesting_states.append(state)
-                    break
+    table = automaton.to_table()
+    mask = find_bb_oracle_mask(table, good_msgs, bad_msgs)
+    return [state for state, is_oracle in zip(table.states, mask.tolist()) if is_oracle]
+
 
-    return interesting_states
+# 在数组形式的状态转移表上一次计算所有状态、所有good/bad消息组合
+# table可以是TransitionTable，返回形状为[n_states]的布尔掩码；
+# 也可以是AutomataStack，返回形状为[n_automata, max_states]的掩码，用于批量扫描整个语料库
+def find_bb_oracle_mask(table, good_msgs, bad_msgs):
+    good = [table.input_index[msg] for msg in good_msgs]
+    bad = [table.input_index[msg] for msg in bad_msgs]
+    next_good = table.next_state[..., good][..., :, None]
+    next_bad = table.next_state[..., bad][..., None, :]
+    output_good = table.output_id[..., good][..., :, None]
+    output_bad = table.output_id[..., bad][..., None, :]
+    differ = (next_good != next_bad) | (output_good != output_bad)
+    return differ.any(axis=(-2, -1))
 
 
+# interesting_states为None时使用find_bb_oracle的结果
 # pylint: disable=too-many-arguments
 def color_bb_oracle(
     automaton,
     good_msgs,
     bad_msgs,
-    interesting_states,
+    interesting_states=None,
     good_color="green",
     bad_color="red",
 ):
+    if interesting_states is None:
+        interesting_states = find_bb_oracle(automaton, good_msgs, bad_msgs)
     if interesting_states:
         for state in interesting_states:
             deemed_good_behaviour = set()
@@ -36,37 +47,142 @@ def color_bb_oracle(
                     colors.add(bad_color)
 
 
-def find_loops(automaton, messages_to_avoid, current_state=0, current_path=None):
+# 查找不经过messages_to_avoid、不进入sink状态的所有循环
+# 先用Tarjan算法求强连通分量，再在每个分量中用Johnson算法枚举基本回路
+# 每个循环以其字典序最小的旋转作为规范形式去重，max_loops限制返回的循环数量
+def find_loops(automaton, messages_to_avoid, current_state=0, max_loops=None):
+    graph = _loop_graph(automaton, messages_to_avoid, current_state)
     aggregated_result = []
-    if not current_path:
-        current_path = []
+    seen_loops = set()
+    for loop in _elementary_cycles(graph):
+        start = loop.index(min(loop))
+        loop = loop[start:] + loop[:start]
+        key = tuple(loop)
+        if key in seen_loops:
+            continue
+        seen_loops.add(key)
+        aggregated_result.append(loop)
+        if max_loops is not None and len(aggregated_result) >= max_loops:
+            break
+    return aggregated_result
 
-    for msg in automaton.input_vocabulary:
-        if msg in messages_to_avoid:
+
+# 从current_state出发可达的子图，graph[state] = [(sent_msg, next_state)]
+def _loop_graph(automaton, messages_to_avoid, current_state):
+    graph = {}
+    to_visit = [current_state]
+    while to_visit:
+        state = to_visit.pop()
+        if state in graph:
             continue
+        graph[state] = []
+        for msg in sorted(automaton.input_vocabulary):
+            if msg in messages_to_avoid:
+                continue
+            next_state, _, _ = automaton.states[state][msg]
+            if automaton.is_sink_state(next_state):
+                continue
+            graph[state].append((msg, next_state))
+            to_visit.append(next_state)
+    return graph
+
+
+# Tarjan强连通分量算法(非递归)，只考虑nodes中的状态
+def _strongly_connected_components(graph, nodes):
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    def successors(node):
+        return (next_state for _, next_state in graph[node] if next_state in nodes)
 
-        next_state, _, _ = automaton.states[current_state][msg]
-        if automaton.is_sink_state(next_state):
+    for root in sorted(nodes):
+        if root in index:
             continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        to_visit = [(root, successors(root))]
+        while to_visit:
+            node, neighbors = to_visit[-1]
+            for neighbor in neighbors:
+                if neighbor not in index:
+                    index[neighbor] = lowlink[neighbor] = len(index)
+                    stack.append(neighbor)
+                    on_stack.add(neighbor)
+                    to_visit.append((neighbor, successors(neighbor)))
+                    break
+                if neighbor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[neighbor])
+            else:
+                to_visit.pop()
+                if to_visit:
+                    parent = to_visit[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
 
-        if next_state in [link[0] for link in current_path]:
-            result = []
-            for state, sent_msg in reversed(current_path + [(current_state, msg)]):
-                result.append((state, sent_msg))
-                if state == next_state:
-                    result.reverse()
-                    if result not in aggregated_result:
-                        aggregated_result.append(result)
+# Johnson基本回路枚举(非递归)，回路以[(state, sent_msg), ...]的形式返回
+def _elementary_cycles(graph):
+    components = _strongly_connected_components(graph, set(graph))
+    while components:
+        component = components.pop()
+        start = min(component)
+        edges = {
+            node: [(msg, next_state) for msg, next_state in graph[node] if next_state in component]
+            for node in component
+        }
+
+        path = [start]
+        path_msgs = []
+        blocked = {start}
+        closed = set()
+        blocked_by = {node: set() for node in component}
+        to_visit = [(start, iter(edges[start]))]
+        while to_visit:
+            node, neighbors = to_visit[-1]
+            for msg, next_state in neighbors:
+                if next_state == start:
+                    yield list(zip(path, path_msgs + [msg]))
+                    closed.update(path)
+                elif next_state not in blocked:
+                    path.append(next_state)
+                    path_msgs.append(msg)
+                    closed.discard(next_state)
+                    blocked.add(next_state)
+                    to_visit.append((next_state, iter(edges[next_state])))
                     break
-        else:
-            recursive_result = find_loops(
-                automaton,
-                messages_to_avoid,
-                current_state=next_state,
-                current_path=current_path + [(current_state, msg)],
-            )
-            for loop in recursive_result:
-                if loop not in aggregated_result:
-                    aggregated_result.append(loop)
+            else:
+                if node in closed:
+                    _unblock(node, blocked, blocked_by)
+                else:
+                    for _, next_state in edges[node]:
+                        blocked_by[next_state].add(node)
+                to_visit.pop()
+                path.pop()
+                if path_msgs:
+                    path_msgs.pop()
 
-    return aggregated_result
+        # 去掉起点后，剩余状态重新划分强连通分量
+        components.extend(_strongly_connected_components(graph, component - {start}))
+
+
+def _unblock(node, blocked, blocked_by):
+    to_unblock = {node}
+    while to_unblock:
+        node = to_unblock.pop()
+        if node in blocked:
+            blocked.remove(node)
+            to_unblock.update(blocked_by[node])
+            blocked_by[node].clear()
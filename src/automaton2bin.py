@@ -0,0 +1,27 @@
+# -*- coding：utf-8 -*-
+# 文本格式与二进制格式状态机之间的转换，转换方向由输入文件的格式决定
+import sys
+from automata.automata import BINARY_AUTOMATON_MAGIC
+from automata.binary import convert_binary_to_text, convert_text_to_binary
+
+
+def usage(message: str):
+    print(message, file=sys.stderr)
+    print(f"Usage: {sys.argv[0]} input_automaton_file output_automaton_file", file=sys.stderr)
+    sys.exit(1)
+
+
+def main():
+    if len(sys.argv) != 3:
+        usage("Invalid arguments")
+
+    with open(sys.argv[1], "rb") as automaton_file:
+        magic = automaton_file.read(len(BINARY_AUTOMATON_MAGIC))
+    if magic == BINARY_AUTOMATON_MAGIC:
+        convert_binary_to_text(sys.argv[1], sys.argv[2])
+    else:
+        convert_text_to_binary(sys.argv[1], sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
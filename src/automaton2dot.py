@@ -1,6 +1,13 @@
 # -*- coding：utf-8 -*-
+import argparse
+import json
+import multiprocessing
+import os
 import sys
-from automata.automata import Automaton, load_automaton_from_file, message_was_not_sent
+from pathlib import Path
+from typing import Dict, List, Set
+from automata.automata import Automaton, load_automaton_from_file, load_automaton_table
+from automata.properties import ReceivedWithoutSent, find_violations
 from automata.vulnerabilities import  find_loops
 
 
@@ -232,9 +239,7 @@ def detect_loops(automaton, crypto_msgs_str="CCS"):
 
 
 def detect_dangerous_flaw_for_client_tls13(automaton):
-    all_paths = automaton.enumerate_paths_until_recv_msg("AppData")
-    vulnerable_paths = filter(lambda path: message_was_not_sent(path, "CV"), all_paths)
-    vulnerable_paths = list(vulnerable_paths)
+    vulnerable_paths = find_violations(automaton, ReceivedWithoutSent("AppData", "CV"))
     if vulnerable_paths:
         for path in vulnerable_paths:
             automaton.color_path(path, "red")
@@ -243,9 +248,7 @@ def detect_dangerous_flaw_for_client_tls13(automaton):
 
 
 def detect_dangerous_flaw_for_client_tls12(automaton):
-    all_paths = automaton.enumerate_paths_until_recv_msg("AppData")
-    vulnerable_paths = filter(lambda path: message_was_not_sent(path, "SKE"), all_paths)
-    vulnerable_paths = list(vulnerable_paths)
+    vulnerable_paths = find_violations(automaton, ReceivedWithoutSent("AppData", "SKE"))
     if vulnerable_paths:
         for path in vulnerable_paths:
             automaton.color_path(path, "red")
@@ -286,28 +289,40 @@ def usage(message: str):
     print(
         f"Usage: {sys.argv[0]} scenario_file automaton_file dot_file", file=sys.stderr
     )
+    print(
+        f"       {sys.argv[0]} batch [options] scenario_file results_directory",
+        file=sys.stderr,
+    )
     sys.exit(1)
 
 
-def main():
-    if len(sys.argv) != 4:
-        usage("Invalid arguments")
+def color_policy(colors):
+    if "green" in colors:
+        return {"green"}, False
+    if colors == {"grey"}:
+        return {"grey"}, True
+    return colors, len(colors) == 0
 
-    # Step 1: load the scenario and the automaton
+
+# 处理一个状态机，返回dot内容以及元数据
+def process_automaton(scenario: str, automaton: Automaton) -> Dict:
+    # Step 1: the automaton was loaded by the caller
 
     # scenario = load_scenario(open(sys.argv[1]), [])
     # for happy_path in scenario.happy_paths:
     #     real_path = automaton.extract_happy_path(happy_path)
     #     if real_path:
     #         automaton.color_path(real_path, "green")
-    scenario = sys.argv[1]
-    automaton: Automaton = load_automaton_from_file(sys.argv[2])
     original_automaton_hash_value = automaton.compute_hash().hex()
 
     # Step 2: rename the messages using shorter names
 
-    automaton = automaton.rename_input_vocabulary(mappings[scenario][0])
-    automaton = automaton.rename_output_vocabulary(mappings[scenario][1])
+    automaton = (
+        automaton.view()
+        .rename_input_vocabulary(mappings[scenario][0])
+        .rename_output_vocabulary(mappings[scenario][1])
+        .materialize()
+    )
 
     # Step 3 (optional): simplify the automaton by merging the alerts into EOF
 
@@ -335,32 +350,126 @@ def main():
     # Step 6: color the state machine and produce the dot content
 
     cleanup_uninteresting_transitions(automaton)
-
-    def color_policy(colors):
-        if "green" in colors:
-            return {"green"}, False
-        if colors == {"grey"}:
-            return {"grey"}, True
-        return colors, len(colors) == 0
-
     dot_content = automaton.dot(color_policy)
-    with open(sys.argv[3], "w", encoding="utf-8") as dot_file:
-        dot_file.write(dot_content)
 
-    # Step 7: print metadata
+    # Step 7: metadata
 
-    working = working_tests[scenario](automaton)
-    processed_automaton_hash_value = automaton.compute_hash().hex()
     bdist_results = automaton.compute_bdist()
-
-    print(f"Original automaton hash = {original_automaton_hash_value}")
-    print(f"Processed automaton hash = {processed_automaton_hash_value}")
-    print(f"The implementation seems to be working? {working}")
-    print(f"Nb States = {len(automaton.states)}")
-    print(f"BDist for this state machine = {bdist_results[0]}")
-    security_results_str = "\n   ".join(security_results)
+    return {
+        "original_hash": original_automaton_hash_value,
+        "processed_hash": automaton.compute_hash().hex(),
+        "working": working_tests[scenario](automaton),
+        "nb_states": len(automaton.states),
+        "bdist": bdist_results[0],
+        "bdist_pairs": bdist_results[1],
+        "security_results": security_results,
+        "dot": dot_content,
+    }
+
+
+def print_metadata(result: Dict):
+    print(f"Original automaton hash = {result['original_hash']}")
+    print(f"Processed automaton hash = {result['processed_hash']}")
+    print(f"The implementation seems to be working? {result['working']}")
+    print(f"Nb States = {result['nb_states']}")
+    print(f"BDist for this state machine = {result['bdist']}")
+    security_results_str = "\n   ".join(result["security_results"])
     print(f"Security results = {security_results_str}")
 
 
+# Batch mode ---------------------------------------------------------
+
+# 修改处理流程后需要增加版本号，使旧的缓存失效
+CACHE_VERSION = 1
+
+
+def cache_filename(cache_dir: Path, scenario: str, automaton_hash: str) -> Path:
+    return cache_dir / f"{scenario}-v{CACHE_VERSION}-{automaton_hash}.json"
+
+
+def _process_automaton_file(task):
+    scenario, automaton_filename = task
+    return process_automaton(scenario, load_automaton_from_file(automaton_filename))
+
+
+# 遍历结果目录，用进程池处理所有状态机
+# 结果以原始状态机的哈希值为键缓存，再次运行时跳过未改变的状态机
+def batch_main(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog=f"{sys.argv[0]} batch",
+        description="Process every automaton found under a results directory",
+    )
+    parser.add_argument("scenario", choices=sorted(mappings))
+    parser.add_argument("results_directory", type=Path)
+    parser.add_argument("--pattern", default="**/final.automaton",
+                        help="glob pattern of the automata, relative to results_directory")
+    parser.add_argument("--dot-name", default="final.dot",
+                        help="name of the dot file written next to each automaton")
+    parser.add_argument("--cache-dir", type=Path,
+                        help="defaults to results_directory/.automaton2dot-cache")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    cache_dir = args.cache_dir or args.results_directory / ".automaton2dot-cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    automaton_filenames = sorted(args.results_directory.glob(args.pattern))
+    results: Dict[Path, Dict] = {}
+    cached: Set[Path] = set()
+    # 哈希值相同的状态机只处理一次
+    to_process: Dict[str, List[Path]] = {}
+    for automaton_filename in automaton_filenames:
+        # 计算哈希值不需要字典形式的状态机，二进制格式直接通过mmap读取
+        automaton_hash = load_automaton_table(str(automaton_filename)).compute_hash().hex()
+        cached_result = cache_filename(cache_dir, args.scenario, automaton_hash)
+        if cached_result.exists():
+            with open(cached_result, encoding="utf-8") as cache_file:
+                results[automaton_filename] = json.load(cache_file)
+            cached.add(automaton_filename)
+        else:
+            to_process.setdefault(automaton_hash, []).append(automaton_filename)
+
+    tasks = [(args.scenario, str(filenames[0])) for filenames in to_process.values()]
+    if args.workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(args.workers) as pool:
+            processed = pool.map(_process_automaton_file, tasks)
+    else:
+        processed = [_process_automaton_file(task) for task in tasks]
+    for (automaton_hash, filenames), result in zip(to_process.items(), processed):
+        for automaton_filename in filenames:
+            results[automaton_filename] = result
+        with open(cache_filename(cache_dir, args.scenario, automaton_hash), "w",
+                  encoding="utf-8") as cache_file:
+            json.dump(result, cache_file, indent=4)
+
+    for automaton_filename in automaton_filenames:
+        result = results[automaton_filename]
+        with open(automaton_filename.with_name(args.dot_name), "w", encoding="utf-8") as dot_file:
+            dot_file.write(result["dot"])
+        status = "cached" if automaton_filename in cached else "processed"
+        security_results_str = ", ".join(result["security_results"]) or "-"
+        print(
+            f"{automaton_filename} ({status}): hash={result['original_hash']}"
+            f" states={result['nb_states']} bdist={result['bdist']}"
+            f" working={result['working']} security={security_results_str}"
+        )
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "batch":
+        batch_main(sys.argv[2:])
+        return
+
+    if len(sys.argv) != 4:
+        usage("Invalid arguments")
+
+    scenario = sys.argv[1]
+    automaton: Automaton = load_automaton_from_file(sys.argv[2])
+    result = process_automaton(scenario, automaton)
+    with open(sys.argv[3], "w", encoding="utf-8") as dot_file:
+        dot_file.write(result["dot"])
+    print_metadata(result)
+
+
 if __name__ == "__main__":
     main()
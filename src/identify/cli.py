@@ -51,7 +51,12 @@ def learn_command(dedup_directory, output, tree_type):
     help="Directory to store intermediate graphs, if desired.",
     type=click.Path(file_okay=False, writable=True),
 )
-def identify_command(target, target_port, tree, graph_dir):
+@click.option(
+    "--fallback-to-nearest",
+    help="Report the closest known models if the target matches none.",
+    is_flag=True,
+)
+def identify_command(target, target_port, tree, graph_dir, fallback_to_nearest):
     """Uses the learned tree to identify the implementation running on the
     target. By default this will use the tree provided with the distribution,
     but a custom tree can be supplied.
@@ -65,7 +70,9 @@ def identify_command(target, target_port, tree, graph_dir):
         tree = pickle.load(tree)
 
     tree.condense()
-    models = identify(tree, target, target_port, graph_dir)
+    models = identify(
+        tree, target, target_port, graph_dir, fallback_to_nearest=fallback_to_nearest
+    )
 
     if models:
         model = list(models)[0]
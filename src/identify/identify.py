@@ -14,10 +14,6 @@ from distutils.version import LooseVersion
 import pkg_resources
 
 
-def _tree_weight(tree, model_mapping, weight_function):
-    return sum([weight_function(model_mapping[model]) for model in tree.models])
-
-
 def equal_model_weight(_):
     return 1
 
@@ -61,11 +57,11 @@ MODEL_WEIGHTS = {
 
 
 def random_selector(tree, current_node, weight_function):
-    return random.choice(list(tree[current_node]))
+    return random.choice(tree.children(current_node))
 
 
 def always_first_selector(tree, current_node, weight_function):
-    return list(tree[current_node])[0]
+    return tree.children(current_node)[0]
 
 
 def gini_selector(tree, current_node, weight_function):
@@ -73,14 +69,12 @@ def gini_selector(tree, current_node, weight_function):
     distinguishing outputs.
     More information here: https://en.wikipedia.org/wiki/Decision_tree_learning#Metrics
     """
-    total_weight = _tree_weight(
-        tree.subtree(current_node), tree.model_mapping, weight_function
-    )
-    input_info = [{"node": node} for node in tree[current_node]]
+    total_weight = tree.subtree_weight(current_node, weight_function)
+    input_info = [{"node": node} for node in tree.children(current_node)]
     for info in input_info:
-        output_nodes = list(tree[info["node"]])
+        output_nodes = tree.children(info["node"])
         weights = [
-            _tree_weight(tree.subtree(output_node), tree.model_mapping, weight_function)
+            tree.subtree_weight(output_node, weight_function)
             for output_node in output_nodes
         ]
         info["metric"] = 1 - sum([(x / total_weight) ** 2 for x in weights])
@@ -93,14 +87,12 @@ def entropy_selector(tree, current_node, weight_function):
     to the most distinguishing outputs.
     More information here: https://en.wikipedia.org/wiki/Decision_tree_learning#Metrics
     """
-    total_weight = _tree_weight(
-        tree.subtree(current_node), tree.model_mapping, weight_function
-    )
-    input_info = [{"node": node} for node in tree[current_node]]
+    total_weight = tree.subtree_weight(current_node, weight_function)
+    input_info = [{"node": node} for node in tree.children(current_node)]
     for info in input_info:
-        output_nodes = list(tree[info["node"]])
+        output_nodes = tree.children(info["node"])
         weights = [
-            _tree_weight(tree.subtree(output_node), tree.model_mapping, weight_function)
+            tree.subtree_weight(output_node, weight_function)
             for output_node in output_nodes
         ]
         info["metric"] = -1 * sum(
@@ -132,28 +124,29 @@ class AbastractConnector(abc.ABC):
     def descent(self, tree, selector, weight_function, graph_dir=None):
         """Descent the tree until a leaf node is reached."""
         # Start at the root of the tree
-        current_node = tuple()
+        current_node = tree.root
+        # The (sent, received) messages of this descent
+        self.trace = []
 
-        leaves = tree.leaves
         descending = True
         while descending:
             # Pick a random node (message to send)
             send_node = selector(tree, current_node, weight_function)
 
             # Send this message and read the response
-            response = self.send(send_node[-1])
+            message = tree.label(send_node)
+            response = self.send(message)
+            self.trace.append((message, response))
 
             # Check if this leads to an existing node, and if this node is a
             # leaf node.
-            response_node = send_node + (response,)
-            try:
-                tree[response_node]
-            except KeyError:
+            response_node = tree.child(send_node, response)
+            if response_node is None:
                 print("No model with this path:")
-                print(response_node)
+                print(tree.path(send_node) + (response,))
                 return
 
-            if response_node in leaves:
+            if tree.is_leaf(response_node):
                 descending = False
             else:
                 current_node = response_node
@@ -168,23 +161,22 @@ class BenchmarkConnector(AbastractConnector):
 
         # Initialize a list to keep track of the messages send and received
         self.messages = []
-        self.current_node = ()
+        self.current_node = tree.root
 
     def send(self, message):
         self.messages.append(message)
-        self.current_node += (message,)
+        self.current_node = self.tree.child(self.current_node, message)
 
-        neighbors = self.tree[self.current_node]
-        for neighbor in neighbors:
-            if self.target in self.tree.subtree(neighbor).models:
-                output = neighbor[-1]
+        for neighbor in self.tree.children(self.current_node):
+            if self.target in self.tree.subtree_models(neighbor):
+                output = self.tree.label(neighbor)
                 self.messages.append(output)
-                self.current_node += (output,)
+                self.current_node = neighbor
                 return output
 
     def reset(self):
         self.messages += ["RESET", ""]
-        self.current_node = ()
+        self.current_node = self.tree.root
 
 
 def _color_path(tree, endpoint, color):
@@ -197,13 +189,16 @@ def _color_path(tree, endpoint, color):
         color: Color to give to the path. If color is False, the color
                 attribute will be removed from the path instead.
     """
-    # The node contains the path information, so it can be used to create
-    # a list of all nodes and all edges to be colored.
-    node_names = tuple(endpoint[:i] for i in range(len(endpoint) + 1))
+    # Walk up from the endpoint to create a list of all nodes and all edges
+    # to be colored.
+    node_names = [endpoint]
+    while node_names[-1] != tree.root:
+        node_names.append(tree.parent(node_names[-1]))
+    node_names.reverse()
     edge_names = tuple(zip(node_names, node_names[1:]))
 
-    nodes = [tree.nodes[name] for name in node_names]
-    edges = [tree.edges[name] for name in edge_names]
+    nodes = [tree.node_attributes(name) for name in node_names]
+    edges = [tree.edge_attributes(*name) for name in edge_names]
 
     for target in nodes + edges:
         if color:
@@ -217,6 +212,24 @@ def _color_path(tree, endpoint, color):
                 pass
 
 
+def _nearest_models(tree, trace):
+    """Return the remaining models closest to the observed trace, using the
+    similarity index built with the tree. Returns None for trees without an
+    index (e.g. trees pickled before the index was added)."""
+    similarity_index = getattr(tree, "similarity_index", None)
+    if similarity_index is None:
+        return None
+    nearest = similarity_index.query_trace(trace, k=len(similarity_index), models=tree.models)
+    if not nearest:
+        return None
+    best_distance = nearest[0][1]
+    closest_models = {model for model, distance in nearest if distance == best_distance}
+    print("Closest known models (distance {:.2f}):".format(best_distance))
+    for model in sorted(closest_models):
+        print(model)
+    return closest_models
+
+
 def identify(
     tree,
     target,
@@ -225,6 +238,7 @@ def identify(
     selector=always_first_selector,
     weight_function=equal_model_weight,
     benchmark=False,
+    fallback_to_nearest=False,
 ):
     # Create output directory if required
     if graph_dir:
@@ -247,6 +261,8 @@ def identify(
         # matched.
         if not leaf_node:
             connector.close()
+            if fallback_to_nearest:
+                return _nearest_models(tree, connector.trace)
             return
 
         if graph_dir:
@@ -258,7 +274,7 @@ def identify(
             )
 
         # Prune the tree
-        leaf_models = tree.nodes[leaf_node]["models"]
+        leaf_models = tree.leaf_models(leaf_node)
         tree.prune_models(tree.models - leaf_models)
 
         if graph_dir:
@@ -3,93 +3,503 @@
 
 import ast
 import json
+from collections import Counter, deque
 from pathlib import Path
 
 import networkx
 import pydot
+from automata.similarity import SimilarityIndex
 from networkx.algorithms.traversal.depth_first_search import dfs_tree
 
+from .util import graph_to_automaton
 
-class ModelTree(networkx.DiGraph):
-    # 父节点
+
+class _TreeIndex:
+    """Indexes of a model tree, kept up to date when the tree is modified.
+
+    Attributes:
+        leaves: The leaf nodes, as the keys of an ordered dict.
+        model_leaves: For every model, the set of leaves containing it.
+        node_models: For every node, a Counter giving for each model the
+            number of leaves of the subtree containing it.
+        weights: For every weight function used with `subtree_weight`, the
+            total weight of the models of every node's subtree.
+        model_weights: For every weight function, the weight of each model.
+        touched: The nodes whose children changed since the last `condense`,
+            or None when the tree has not been condensed since the index was
+            built.
+    """
+
+    def __init__(self):
+        self.leaves = {}
+        self.model_leaves = {}
+        self.node_models = {}
+        self.weights = {}
+        self.model_weights = {}
+        self.touched = None
+
+
+class AbstractModelTree:
+    """Operations shared by the model tree backends (ModelTree and
+    TrieModelTree).
+
+    Nodes are opaque handles: the root is `tree.root`, the children of a node
+    are reached with `children` and `child`, and `label`/`path` give the
+    messages leading to a node. Leaves store the set of models sharing the
+    path from the root. Subclasses provide the storage primitives:
+    `_iter_nodes`, `_parent_or_none`, `_stored_models`, `_store_models`,
+    `children`, `is_leaf`, `remove_node`, `remove_nodes_from` and `__len__`.
+    """
+
+    # 索引在第一次查询时建立(包括从pickle文件读取的树)，之后随树的修改增量更新
+    # 子图视图(subtree)没有索引，查询时遍历节点
+    def __getstate__(self):
+        # The indexes are not pickled: they are rebuilt on demand, which keeps
+        # pickles compact and avoids pickling the weight functions.
+        state = dict(self.__dict__)
+        state.pop("_tree_index", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def _index(self):
+        if "_graph" in self.__dict__:
+            return None
+        index = self.__dict__.get("_tree_index")
+        if index is None:
+            index = self._tree_index = self._build_index()
+        return index
+
+    # 自底向上合并子节点的计数，每个节点只访问一次
+    def _build_index(self):
+        index = _TreeIndex()
+        to_visit = [node for node in self._iter_nodes() if self._parent_or_none(node) is None]
+        for node in to_visit:
+            to_visit.extend(self.children(node))
+        for node in reversed(to_visit):
+            if self.is_leaf(node):
+                index.node_models[node] = Counter(self._stored_models(node))
+            else:
+                node_models = index.node_models[node] = Counter()
+                for child in self.children(node):
+                    node_models.update(index.node_models[child])
+        for node in self._iter_nodes():
+            if self.is_leaf(node):
+                index.leaves[node] = None
+                for model in self._stored_models(node):
+                    index.model_leaves.setdefault(model, set()).add(node)
+        return index
+
+    # 节点及其所有祖先节点
+    def _ancestors_and_self(self, node):
+        while node is not None:
+            yield node
+            node = self._parent_or_none(node)
+
+    # 将counter加到(sign=1)或减去(sign=-1)节点及其祖先节点的计数上
+    # 子树中的状态机集合发生变化时，同时更新已缓存的子树权重
+    def _propagate(self, index, node, counter, sign):
+        if not counter:
+            return
+        for ancestor in self._ancestors_and_self(node):
+            node_models = index.node_models[ancestor]
+            for model, count in counter.items():
+                previous = node_models[model]
+                node_models[model] = previous + sign * count
+                if node_models[model] == 0:
+                    del node_models[model]
+                    self._adjust_weights(index, ancestor, model, -1)
+                elif previous == 0:
+                    self._adjust_weights(index, ancestor, model, 1)
+
+    def _model_weight(self, index, weight_function, model):
+        model_weights = index.model_weights[weight_function]
+        if model not in model_weights:
+            model_weights[model] = weight_function(self.model_mapping[model])
+        return model_weights[model]
+
+    def _adjust_weights(self, index, node, model, sign):
+        for weight_function, weights in index.weights.items():
+            weights[node] += sign * self._model_weight(index, weight_function, model)
+
+    def _index_add_node(self, index, node):
+        index.node_models[node] = Counter()
+        for weights in index.weights.values():
+            weights[node] = 0
+
+    def _index_add_leaf(self, index, node):
+        index.leaves[node] = None
+        models = self._stored_models(node)
+        for model in models:
+            index.model_leaves.setdefault(model, set()).add(node)
+        self._propagate(index, node, Counter(models), 1)
+
+    def _index_remove_leaf(self, index, node):
+        del index.leaves[node]
+        models = self._stored_models(node)
+        for model in models:
+            index.model_leaves[model].discard(node)
+            if not index.model_leaves[model]:
+                del index.model_leaves[model]
+        self._propagate(index, node, Counter(models), -1)
+
+    # 删除节点前更新索引：子树中的状态机从祖先节点的计数中减去
+    def _index_before_remove(self, index, node):
+        if node in index.leaves:
+            self._index_remove_leaf(index, node)
+        else:
+            parent = self._parent_or_none(node)
+            if parent is not None:
+                self._propagate(index, parent, index.node_models[node], -1)
+
+    # 删除节点后更新索引：失去所有子节点的父节点成为叶节点
+    def _index_after_remove(self, index, node, parent):
+        del index.node_models[node]
+        for weights in index.weights.values():
+            del weights[node]
+        if parent is not None:
+            self._index_touch(index, parent)
+            if self.is_leaf(parent):
+                self._index_add_leaf(index, parent)
+
+    # 记录子节点发生变化的节点，下一次condense只检查这些节点附近的分支
+    @staticmethod
+    def _index_touch(index, node):
+        if index.touched is not None:
+            index.touched.add(node)
+
+    # 父节点，根节点没有父节点，抛出IndexError
     def parent(self, node):
-        return list(self.predecessors(node))[0]
+        parent = self._parent_or_none(node)
+        if parent is None:
+            raise IndexError(node)
+        return parent
 
     # 所有叶节点
     @property
     def leaves(self):
-        return [node for node in self.nodes if self.out_degree(node) == 0]
+        index = self._index()
+        if index is None:
+            return [node for node in self._iter_nodes() if self.is_leaf(node)]
+        return list(index.leaves)
 
     # 所有状态机
     @property
     def models(self):
-        return {
-            _models for leaf in self.leaves for _models in self.nodes[leaf]["models"]
-        }
-
-    # 以传入节点为根的子树
-    def subtree(self, node):
-        subtree_nodes = dfs_tree(self, node).nodes
-        return self.subgraph(subtree_nodes)
-
-    # 删除节点
+        index = self._index()
+        if index is None:
+            return {
+                _models for leaf in self.leaves for _models in self._stored_models(leaf)
+            }
+        return set(index.model_leaves)
+
+    # 叶节点的状态机集合
+    def leaf_models(self, node):
+        return set(self._stored_models(node))
+
+    # 以传入节点为根的子树中的所有状态机
+    def subtree_models(self, node):
+        index = self._index()
+        if index is not None:
+            return set(index.node_models[node])
+        models = set()
+        to_visit = [node]
+        while to_visit:
+            current_node = to_visit.pop()
+            if self.is_leaf(current_node):
+                models.update(self._stored_models(current_node))
+            else:
+                to_visit.extend(self.children(current_node))
+        return models
+
+    # 子树中所有状态机的权重之和，weight_function的参数为状态机对应的实现版本(model_mapping)
+    # 每个权重函数第一次使用时计算所有节点的权重，之后随树的修改只更新受影响的祖先节点
+    def subtree_weight(self, node, weight_function):
+        index = self._index()
+        if index is None:
+            return sum(
+                weight_function(self.model_mapping[model])
+                for model in self.subtree_models(node)
+            )
+        if weight_function not in index.weights:
+            index.model_weights[weight_function] = {}
+            index.weights[weight_function] = {
+                tree_node: sum(
+                    self._model_weight(index, weight_function, model)
+                    for model in node_models
+                )
+                for tree_node, node_models in index.node_models.items()
+            }
+        return index.weights[weight_function][node]
+
+    # 修改叶节点的状态机集合，通过该方法修改才能保持索引正确
+    def set_models(self, node, models):
+        index = self.__dict__.get("_tree_index")
+        if index is not None and node in index.leaves:
+            self._index_remove_leaf(index, node)
+            self._store_models(node, set(models))
+            self._index_add_leaf(index, node)
+        else:
+            self._store_models(node, set(models))
+
+    # 删除节点，以及因此失去所有子节点的祖先节点(从最上层的祖先开始删除)
     def prune_node(self, node):
-        try:
-            parent = self.parent(node)
-            if self.out_degree(parent) == 1:
-                self.prune_node(parent)
-        except IndexError:
-            pass
+        chain = [node]
+        parent = self._parent_or_none(node)
+        while parent is not None and len(self.children(parent)) == 1:
+            chain.append(parent)
+            parent = self._parent_or_none(parent)
 
-        self.remove_node(node)
+        for chain_node in reversed(chain):
+            self.remove_node(chain_node)
 
-    # 删除状态机
+    # 删除状态机，只访问包含这些状态机的叶节点
     def prune_models(self, models):
-        models = set(models)
-        for leaf in self.leaves:
-            self.nodes[leaf]["models"] -= models
-            if not self.nodes[leaf]["models"]:
+        index = self._index()
+        affected_leaves = set()
+        for model in models:
+            affected_leaves |= index.model_leaves.get(model, set())
+        for leaf in [leaf for leaf in index.leaves if leaf in affected_leaves]:
+            self.set_models(leaf, self.leaf_models(leaf) - set(models))
+            if not self._stored_models(leaf):
                 self.prune_node(leaf)
 
     # 缩短分支长度
     def condense(self):
-        # 删除包含所有状态机的叶节点
-        models = self.models
-        for leaf in self.leaves:
-            if self.nodes[leaf]["models"] == models:
+        index = self._index()
+        while True:
+            # 删除包含所有状态机的叶节点
+            models = self.models
+            for leaf in self._leaves_with_models(index, models):
                 self.prune_node(leaf)
-        # 缩短路径长度
-        ancestors = {self.parent(self.parent(leaf)) for leaf in self.leaves}
-        tree_start_size = len(self)
-        for node in ancestors:
-            subtree = self.subtree(node)
-            leaves = subtree.leaves
-            models = subtree.models
-
-            # For every available input, we check if it is redundant. This is
-            # the case when:
-            # - The input only has one possible output.
-            # - This output leads to a leaf node.
-            redundant_nodes = set()
-            for input_node in subtree[node]:
-                output_nodes = list(subtree.neighbors(input_node))
-                if len(output_nodes) == 1 and output_nodes[0] in leaves:
-                    # If this is the case, these nodes as redundant
-                    redundant_nodes.update([input_node, output_nodes[0]])
-
-            # Remove the redundant nodes
-            self.remove_nodes_from(redundant_nodes)
 
-            # After (possibly) removing some paths, we now check if the
-            # ancestor has any paths lefts in the original tree.
-            if self.out_degree(node) == 0:
-                # If not, we move the information about the models to this
-                # node.
-                self.nodes[node]["models"] = models
+            # 只有缩短路径改变了树时才继续下一轮，只删除了叶节点时停止
+            tree_start_size = len(self)
 
-        # If the tree has changed, condense it again
-        if len(self) != tree_start_size:
-            self.condense()
+            # 缩短路径长度
+            # 第一次只需要检查上一次condense之后被修改的节点附近的分支，之后每一轮只检查
+            # 上一轮被修改的节点附近的分支，其余分支在之前已经检查过，不会再发生变化
+            if index is None or index.touched is None:
+                leaves = self.leaves
+            else:
+                leaves = [
+                    leaf
+                    for node in index.touched if node in self
+                    for leaf in [node] + self.children(node) if self.is_leaf(leaf)
+                ]
+            if index is not None:
+                index.touched = set()
+            ancestors = set()
+            for leaf in leaves:
+                parent = self._parent_or_none(leaf)
+                if parent is not None and self._parent_or_none(parent) is not None:
+                    ancestors.add(self._parent_or_none(parent))
+
+            # 按路径排序，使结果与集合的遍历顺序(即字符串的哈希值)以及树的实现无关
+            for node in sorted(ancestors, key=self.path):
+                if node not in self or self.is_leaf(node):
+                    continue
+                models = self.subtree_models(node)
+
+                # For every available input, we check if it is redundant. This is
+                # the case when:
+                # - The input only has one possible output.
+                # - This output leads to a leaf node.
+                redundant_nodes = set()
+                for input_node in self.children(node):
+                    output_nodes = self.children(input_node)
+                    if len(output_nodes) == 1 and self.is_leaf(output_nodes[0]):
+                        # If this is the case, these nodes as redundant
+                        redundant_nodes.update([input_node, output_nodes[0]])
+
+                # Remove the redundant nodes. If the ancestor has no paths left
+                # in the original tree, the information about the models is
+                # moved to this node.
+                self._remove_branches(node, redundant_nodes, models)
+
+            # If the tree has not changed, it is fully condensed
+            if len(self) == tree_start_size:
+                return
+
+    # 删除node下多余的节点，node因此成为叶节点时保存models
+    # 删除时不逐个更新索引，最后将node的状态机计数的变化一次性传递给祖先节点，
+    # 合并单一路径时计数不变，不需要访问祖先节点
+    def _remove_branches(self, node, redundant_nodes, models):
+        index = self.__dict__.get("_tree_index")
+        if index is None:
+            self.remove_nodes_from(redundant_nodes)
+            if self.is_leaf(node):
+                self.set_models(node, models)
+            return
+
+        new_models = Counter(index.node_models[node])
+        for removed in redundant_nodes:
+            if removed in index.leaves:
+                del index.leaves[removed]
+                for model in self._stored_models(removed):
+                    new_models[model] -= 1
+                    index.model_leaves[model].discard(removed)
+                    if not index.model_leaves[model]:
+                        del index.model_leaves[model]
+            del index.node_models[removed]
+            for weights in index.weights.values():
+                del weights[removed]
+        self._tree_index = None
+        try:
+            self.remove_nodes_from(redundant_nodes)
+        finally:
+            self._tree_index = index
+        self._index_touch(index, node)
+
+        if self.is_leaf(node):
+            self._store_models(node, set(models))
+            index.leaves[node] = None
+            for model in models:
+                index.model_leaves.setdefault(model, set()).add(node)
+            new_models = Counter(models)
+        added = Counter(new_models)
+        added.subtract(index.node_models[node])
+        self._propagate(index, node, +added, 1)
+        self._propagate(index, node, -added, -1)
+
+    # 状态机集合等于models的叶节点，这些叶节点一定包含最少出现的状态机
+    def _leaves_with_models(self, index, models):
+        if index is None or not index.model_leaves:
+            candidates = self.leaves
+        else:
+            candidates = min(index.model_leaves.values(), key=len)
+        return [leaf for leaf in candidates if self.leaf_models(leaf) == models]
+
+
+class ModelTree(AbstractModelTree, networkx.DiGraph):
+    # 节点为从根节点出发的消息序列(tuple)
+    root = ()
+
+    def _iter_nodes(self):
+        return iter(self._node)
+
+    def _parent_or_none(self, node):
+        parents = self._pred[node]
+        if not parents:
+            return None
+        return next(iter(parents))
+
+    def _stored_models(self, node):
+        return self._node[node].get("models", ())
+
+    def _store_models(self, node, models):
+        self._node[node]["models"] = models
+
+    def add_node(self, node_for_adding, **attr):
+        index = self.__dict__.get("_tree_index")
+        if index is None:
+            super().add_node(node_for_adding, **attr)
+            return
+        if node_for_adding not in self._node:
+            super().add_node(node_for_adding, **attr)
+            self._index_add_node(index, node_for_adding)
+            self._index_add_leaf(index, node_for_adding)
+        elif "models" in attr and node_for_adding in index.leaves:
+            self._index_remove_leaf(index, node_for_adding)
+            super().add_node(node_for_adding, **attr)
+            self._index_add_leaf(index, node_for_adding)
+        else:
+            super().add_node(node_for_adding, **attr)
+
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        if self.__dict__.get("_tree_index") is None:
+            super().add_nodes_from(nodes_for_adding, **attr)
+            return
+        for node in nodes_for_adding:
+            try:
+                # Same convention as networkx: nodes are hashable, while
+                # (node, attribute dict) tuples are not
+                hash(node)
+                node_attr = attr
+            except TypeError:
+                node, data = node
+                node_attr = {**attr, **data}
+            self.add_node(node, **node_attr)
+
+    def add_edge(self, u_of_edge, v_of_edge, **attr):
+        index = self.__dict__.get("_tree_index")
+        if index is None or self.has_edge(u_of_edge, v_of_edge):
+            super().add_edge(u_of_edge, v_of_edge, **attr)
+            return
+        self.add_node(u_of_edge)
+        self.add_node(v_of_edge)
+        if u_of_edge in index.leaves:
+            self._index_remove_leaf(index, u_of_edge)
+        self._index_touch(index, u_of_edge)
+        super().add_edge(u_of_edge, v_of_edge, **attr)
+        self._propagate(index, u_of_edge, index.node_models[v_of_edge], 1)
+
+    def add_edges_from(self, ebunch_to_add, **attr):
+        if self.__dict__.get("_tree_index") is None:
+            super().add_edges_from(ebunch_to_add, **attr)
+            return
+        for edge in ebunch_to_add:
+            if len(edge) == 3:
+                u_of_edge, v_of_edge, data = edge
+            else:
+                u_of_edge, v_of_edge = edge
+                data = {}
+            self.add_edge(u_of_edge, v_of_edge, **{**attr, **data})
+
+    def remove_node(self, n):
+        index = self.__dict__.get("_tree_index")
+        if index is None or n not in self._node:
+            super().remove_node(n)
+            return
+        self._index_before_remove(index, n)
+        parent = self._parent_or_none(n)
+        super().remove_node(n)
+        self._index_after_remove(index, n, parent)
+
+    def remove_nodes_from(self, nodes):
+        if self.__dict__.get("_tree_index") is None:
+            super().remove_nodes_from(nodes)
+            return
+        for node in list(nodes):
+            if node in self._node:
+                self.remove_node(node)
+
+    def is_leaf(self, node):
+        return self.out_degree(node) == 0
+
+    def children(self, node):
+        return list(self._succ[node])
+
+    # 标签为label的子节点，不存在时返回None
+    def child(self, node, label):
+        child = node + (label,)
+        if child in self._succ[node]:
+            return child
+        return None
+
+    def add_child(self, node, label):
+        child = node + (label,)
+        self.add_edge(node, child, label=label)
+        return child
+
+    def label(self, node):
+        return node[-1]
+
+    # 从根节点到该节点的消息序列
+    def path(self, node):
+        return node
+
+    def node_attributes(self, node):
+        return self.nodes[node]
+
+    def edge_attributes(self, parent, node):
+        return self.edges[parent, node]
+
+    # 以传入节点为根的子树
+    def subtree(self, node):
+        subtree_nodes = dfs_tree(self, node).nodes
+        return self.subgraph(subtree_nodes)
 
     # 画出状态树
     def draw(self, fmt="dot", path=None):
@@ -132,111 +542,133 @@ def normalize_graph(dot_graph: str, *, max_depth=10) -> ModelTree:
     Returns:
         A normalized ModelTree which represents the input graph.
     """
-    graph = _dot_to_networkx(dot_graph)
+    # Create the ModelTree that will contain the normalized graph
+    tree = ModelTree()
+    tree.add_node(tree.root)
+
+    merge_graph(tree, _dot_to_networkx(dot_graph), max_depth=max_depth)
+    return tree
 
+
+def merge_graph(tree, graph: networkx.DiGraph, *, max_depth=10) -> list:
+    """Merge the tree unrolled from a graph into the passed tree, beginning at
+    its root. This is equivalent to merging the edges of
+    `normalize_graph(graph)`, without building the intermediate tree.
+    Args:
+        tree: The tree into which the graph will be merged, a ModelTree or a
+            TrieModelTree.
+        graph: The graph to merge, as returned by `_dot_to_networkx`.
+        max_depth: The maximum depth of the unrolled tree.
+    Returns:
+        The nodes of `tree` that are leaves of the unrolled graph, the caller
+        adds the model to these nodes.
+    """
     # Assumes there is a node called '__start0', which is connected a single
     # node in the graph (the entry point)
     graph_root = list(graph["__start0"])[0]
 
-    # Create the ModelTree that will contain the normalized graph
-    tree = ModelTree()
-    tree_root = ()
-    tree.add_node(tree_root)
-
-    # Normalize the graph by recursively merging into the tree
-    return _merge_subgraph(tree, tree_root, graph, graph_root, 0, max_depth)
-
-
-# 将状态机转换为树
-# dfs
-def _merge_subgraph(
-        tree: ModelTree,
-        root: tuple,
-        graph: networkx.DiGraph,
-        current_node: str,
-        current_depth: int,
-        max_depth: int,
-) -> ModelTree:
-    """Recursively merge a directed graph into the passed ModelTree. This is an
-    internal function that is called from `normalize_graph`.
-    Args:
-        tree: The tree that is being constructed, and into which the graph will
-            be merged.
-        root: The current root node of the tree, the graph will be merged
-            beginning at this node.
-        graph: The graph to merge into the tree
-        current_node: The current node of the graph to merge
-        current_depth: The current recursion depth, this function aborts when
-            depth > max_depth.
-        max_depth: The maximum recursion depth, primaraly useful to escape
-            cycles, so it should be higher than the valid depth of the tree.
-    """
-    # If we exceeded the max depth, we stop
-    if current_depth > max_depth:
-        return tree
+    unrolled = _unroll_graph(graph, graph_root, max_depth)
+    return _merge_unrolled(tree, unrolled, _unrolled_key(unrolled, graph_root, 0))
+
+
+# 将状态机展开为树，相同的(状态, 深度)只展开一次
+# 结果为(状态, 深度) -> [(sent, received, 子树)]，子树为展开后的(状态, 深度)，
+# 子树为空(终止、吸收态或超过最大深度)时为None
+def _unroll_graph(graph: networkx.DiGraph, graph_root: str, max_depth: int) -> dict:
+    # 每条边的标签只解析一次
+    edges = {}
+    unrolled = {}
+    to_visit = deque([(graph_root, 0)])
+    while to_visit:
+        current_node, current_depth = to_visit.popleft()
+        if (current_node, current_depth) in unrolled:
+            continue
+
+        # If we exceeded the max depth, we stop
+        if current_depth > max_depth:
+            unrolled[current_node, current_depth] = []
+            continue
+
+        if current_node not in edges:
+            edges[current_node] = _graph_edges(graph, current_node)
+        neighbors = list(graph[current_node])
+
+        subtree = []
+        for neighbor, sent, received in edges[current_node]:
+            # 当状态机的一条边的输出为EOF的时候，说明遍历到了终止状态，停止遍历
+            # 吸收态也停止遍历
+            if "EOF" in received or neighbors == [current_node]:
+                subtree.append((sent, received, None))
+            else:
+                subtree.append((sent, received, (neighbor, current_depth + 1)))
+                to_visit.append((neighbor, current_depth + 1))
+        unrolled[current_node, current_depth] = subtree
 
-    neighbors = list(graph[current_node])
+    # 展开后为空的子树(没有转移或超过最大深度)改为None，对应的节点是叶节点
+    for key, subtree in unrolled.items():
+        unrolled[key] = [
+            (sent, received, _unrolled_key(unrolled, *child) if child else None)
+            for sent, received, child in subtree
+        ]
+    return unrolled
 
-    # If a node has no neighbors, there is nothing to do and this function
-    # returns immediately.
-    if not neighbors:
-        return tree
 
-    # A node can have multiple neighbors
-    for neighbor in neighbors:
+def _unrolled_key(unrolled: dict, graph_node: str, depth: int):
+    if unrolled.get((graph_node, depth)):
+        return graph_node, depth
+    return None
 
+
+def _graph_edges(graph: networkx.DiGraph, current_node: str) -> list:
+    """The outgoing edges of a graph node, as (neighbor, sent, received)
+    tuples, in the order of the graph.
+    """
+    edges = []
+    # A node can have multiple neighbors
+    for neighbor in graph[current_node]:
         # There can be multiple edges between two nodes, each with
         # a different label. Each edge is numbered, but we ignore this
         # number.
         for _, edge in graph[current_node][neighbor].items():
-            received_node = _merge_path_from_label(tree, root, edge["label"])
-
-            # 当状态机的一条边的输出为EOF的时候，说明遍历到了终止状态，停止遍历
-            if "EOF" in received_node[-1]:
-                # Do not recurse
-                continue
-
-            # 吸收态也停止遍历
-            if neighbors == [current_node]:
-                continue
-
-            # Recurse with new root and current node
-            tree = _merge_subgraph(
-                tree, received_node, graph, neighbor, current_depth + 1, max_depth
-            )
-
-    return tree
-
-
-def _merge_path_from_label(tree: ModelTree, root: tuple, label: str) -> tuple:
-    """Merge a path into the passed tree from a label. The label is assumed to
-    have the format "{{ sent }} / {{ received }}", since this is the format
-    that StateLearner outputs. The nodes will be added as
-        root -> sent -> received
-    with the appropriate edge labels.
-    Args:
-        tree: The path will be added to this graph.
-        root: Point in the tree where the nodes will be added.
-        label: String of the format "{{ sent }} / {{ received }}"
-    Returns:
-        The name of the "received" node (which is a tuple), so the caller knows
-        the endpoint of the added path.
+            edges.append((neighbor, *_split_label(edge["label"])))
+    return edges
+
+
+# 将展开的状态机合并到树中
+# 按BFS顺序添加节点，每个节点的子节点的顺序与深度优先遍历状态机时相同，
+# 同一个树节点上的同一棵子树只合并一次
+def _merge_unrolled(tree, unrolled: dict, root_key) -> list:
+    leaves = {tree.root: None}
+    expanded = set()
+    merged = set()
+    to_visit = deque([(tree.root, root_key)] if root_key else [])
+    while to_visit:
+        root, key = to_visit.popleft()
+        if (root, key) in merged:
+            continue
+        merged.add((root, key))
+        expanded.add(root)
+
+        for sent, received, child_key in unrolled[key]:
+            received_node = tree.add_child(tree.add_child(root, sent), received)
+            leaves[received_node] = None
+            if child_key:
+                to_visit.append((received_node, child_key))
+
+    return [leaf for leaf in leaves if leaf not in expanded]
+
+
+def _split_label(label: str) -> tuple:
+    """Split a label into the sent and received messages. The label is
+    assumed to have the format "{{ sent }} / {{ received }}", since this is the
+    format that StateLearner outputs.
     """
-    # We start by extracting the sent and received messages. Split the label
-    # in the sent and received message. Remove the double quotes and the excess
-    # whitespace.
+    # Split the label in the sent and received message. Remove the double
+    # quotes and the excess whitespace.
     sent, received = [
         message.replace('"', "").strip() for message in label.split("/", maxsplit=1)
     ]
-
-    # Append the sent and received messages to the tree
-    # 节点编码
-    sent_node = root + (sent,)
-    received_node = root + (sent, received)
-    tree.add_edge(root, sent_node, label=sent)
-    tree.add_edge(sent_node, received_node, label=received)
-
-    return received_node
+    return sent, received
 
 
 def _dot_to_networkx(dot_graph):
@@ -265,8 +697,14 @@ def construct_tree_from_dedup(directory: str, tree_type: str) -> ModelTree:
 
     path = Path(directory)
 
+    # Index of the models, used to find the closest known models when the
+    # target does not match any path of the tree. It is filled while the
+    # models are merged, so that every model is parsed once.
+    similarity_index = SimilarityIndex()
+
     # Build the tree using the specified tree type handler
-    tree = handler(path)
+    tree = handler(path, similarity_index)
+    tree.similarity_index = similarity_index
 
     # Add the model mapping information to the tree
     tree.model_mapping = {}
@@ -283,30 +721,40 @@ def construct_tree_from_dedup(directory: str, tree_type: str) -> ModelTree:
     return tree
 
 
-def _construct_hdt(path: Path) -> ModelTree:
+def _construct_hdt(path: Path, similarity_index: SimilarityIndex) -> ModelTree:
     tree = ModelTree()
-    tree_root = ()
-    tree.add_node(tree_root)
+    tree.add_node(tree.root)
+    _merge_models(tree, path, similarity_index)
+    tree.condense()
+    return tree
 
-    model_directories = sorted([item for item in path.iterdir() if item.is_dir()])
-    for model_dir in model_directories:
-        with open(model_dir / "model.gv") as f:
-            # 将状态机转换为树
-            graph = normalize_graph(f.read())
-            # 合并树
-            tree.add_edges_from(graph.edges(data=True))
-            for leaf in graph.leaves:
-                try:
-                    # 如果状态机树的叶节点与状态树叶节点重合，那么说明该叶节点对应的
-                    # 状态机共享从根节点到叶节点的路径，将新加入的状态机名称加入该叶节点
-                    tree.nodes[leaf]["models"].add(model_dir.name)
-                except KeyError:
-                    # 状态树中没有状态机树的叶节点，说明是新的叶节点，创建一个字典
-                    tree.nodes[leaf]["models"] = {model_dir.name}
 
+def _construct_trie(path: Path, similarity_index: SimilarityIndex):
+    # pylint: disable=import-outside-toplevel
+    from .trie import TrieModelTree
+
+    tree = TrieModelTree()
+    _merge_models(tree, path, similarity_index)
     tree.condense()
+    tree.compact()
     return tree
 
 
-_tree_type_handlers = {"hdt": _construct_hdt}
+# 将目录中的所有状态机展开并合并到树中，同时加入similarity_index
+def _merge_models(tree, path: Path, similarity_index: SimilarityIndex):
+    model_directories = sorted([item for item in path.iterdir() if item.is_dir()])
+    for model_dir in model_directories:
+        with open(model_dir / "model.gv") as f:
+            graph = _dot_to_networkx(f.read())
+        similarity_index.add(model_dir.name, graph_to_automaton(graph))
+        # 将状态机展开并合并到树中
+        leaves = merge_graph(tree, graph)
+        for leaf in leaves:
+            # 如果状态机树的叶节点与状态树叶节点重合，那么说明该叶节点对应的
+            # 状态机共享从根节点到叶节点的路径，将新加入的状态机名称加入该叶节点；
+            # 否则是新的叶节点，创建一个集合
+            tree.set_models(leaf, tree.leaf_models(leaf) | {model_dir.name})
+
+
+_tree_type_handlers = {"hdt": _construct_hdt, "trie": _construct_trie}
 SUPPORTED_TREE_TYPES = list(_tree_type_handlers.keys())
@@ -0,0 +1,239 @@
+# -*- coding：utf-8 -*-
+# 紧凑的状态树：节点为整数编号，只保存父节点、边的标签编号和子节点映射
+# 与ModelTree相比，节点不再保存从根节点出发的完整消息序列，也没有networkx的属性字典
+from array import array
+
+from .learn import AbstractModelTree, ModelTree
+
+# parents中的特殊值
+NO_PARENT = -1
+REMOVED = -2
+
+
+class TrieModelTree(AbstractModelTree):
+    root = 0
+
+    def __init__(self):
+        # 边的标签只保存一次
+        self.labels = []
+        self.label_ids = {}
+        # parents[node]为父节点，node_labels[node]为从父节点到该节点的边的标签编号
+        self.parents = array("i", [NO_PARENT])
+        self.node_labels = array("i", [NO_PARENT])
+        # 标签编号 -> 子节点，叶节点为None
+        self.child_maps = [None]
+        # 节点 -> 状态机集合，只保存设置过的节点
+        self.models_table = {}
+        # 节点与入边的属性(例如color)，只保存设置过的节点
+        self.node_attrs = {}
+        self.edge_attrs = {}
+        self.size = 1
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, node):
+        return 0 <= node < len(self.parents) and self.parents[node] != REMOVED
+
+    def _iter_nodes(self):
+        return (node for node, parent in enumerate(self.parents) if parent != REMOVED)
+
+    def _parent_or_none(self, node):
+        parent = self.parents[node]
+        if parent == NO_PARENT:
+            return None
+        return parent
+
+    def _stored_models(self, node):
+        return self.models_table.get(node, ())
+
+    def _store_models(self, node, models):
+        self.models_table[node] = models
+
+    def is_leaf(self, node):
+        return not self.child_maps[node]
+
+    def children(self, node):
+        child_map = self.child_maps[node]
+        if not child_map:
+            return []
+        return list(child_map.values())
+
+    # 标签为label的子节点，不存在时返回None
+    def child(self, node, label):
+        label_id = self.label_ids.get(label)
+        child_map = self.child_maps[node]
+        if label_id is None or not child_map:
+            return None
+        return child_map.get(label_id)
+
+    def add_child(self, node, label):
+        existing = self.child(node, label)
+        if existing is not None:
+            return existing
+
+        label_id = self.label_ids.get(label)
+        if label_id is None:
+            label_id = self.label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        child = len(self.parents)
+        self.parents.append(node)
+        self.node_labels.append(label_id)
+        self.child_maps.append(None)
+        if self.child_maps[node] is None:
+            self.child_maps[node] = {}
+        self.child_maps[node][label_id] = child
+        self.size += 1
+
+        index = self.__dict__.get("_tree_index")
+        if index is not None:
+            if node in index.leaves:
+                self._index_remove_leaf(index, node)
+            self._index_touch(index, node)
+            self._index_add_node(index, child)
+            self._index_add_leaf(index, child)
+        return child
+
+    def label(self, node):
+        return self.labels[self.node_labels[node]]
+
+    # 从根节点到该节点的消息序列
+    def path(self, node):
+        labels = []
+        while self.parents[node] >= 0:
+            labels.append(self.label(node))
+            node = self.parents[node]
+        return tuple(reversed(labels))
+
+    # 删除节点，子节点(如果有)成为没有父节点的树，与ModelTree的行为相同
+    def remove_node(self, n):
+        if n not in self:
+            raise KeyError(n)
+        index = self.__dict__.get("_tree_index")
+        if index is not None:
+            self._index_before_remove(index, n)
+
+        parent = self._parent_or_none(n)
+        if parent is not None:
+            child_map = self.child_maps[parent]
+            del child_map[self.node_labels[n]]
+            if not child_map:
+                self.child_maps[parent] = None
+        for child in self.children(n):
+            self.parents[child] = NO_PARENT
+        self.parents[n] = REMOVED
+        self.child_maps[n] = None
+        self.models_table.pop(n, None)
+        self.node_attrs.pop(n, None)
+        self.edge_attrs.pop(n, None)
+        self.size -= 1
+
+        if index is not None:
+            self._index_after_remove(index, n, parent)
+
+    def remove_nodes_from(self, nodes):
+        for node in list(nodes):
+            if node in self:
+                self.remove_node(node)
+
+    # 删除的节点仍然占用编号，重新按BFS顺序编号以释放空间
+    # 只保留从根节点可达的节点，之前得到的节点编号全部失效
+    def compact(self):
+        if self.root not in self:
+            return
+        mapping = {}
+        to_visit = [self.root]
+        for node in to_visit:
+            mapping[node] = len(mapping)
+            to_visit.extend(self.children(node))
+
+        parents = array("i", [NO_PARENT]) * len(mapping)
+        node_labels = array("i", [NO_PARENT]) * len(mapping)
+        child_maps = [None] * len(mapping)
+        for node, new_node in mapping.items():
+            if node != self.root:
+                parents[new_node] = mapping[self.parents[node]]
+                node_labels[new_node] = self.node_labels[node]
+            if self.child_maps[node]:
+                child_maps[new_node] = {
+                    label_id: mapping[child] for label_id, child in self.child_maps[node].items()
+                }
+        self.parents = parents
+        self.node_labels = node_labels
+        self.child_maps = child_maps
+        for name in ("models_table", "node_attrs", "edge_attrs"):
+            table = getattr(self, name)
+            setattr(self, name, {
+                mapping[node]: value for node, value in table.items() if node in mapping
+            })
+        self.size = len(mapping)
+        self.__dict__.pop("_tree_index", None)
+
+    def node_attributes(self, node):
+        return self.node_attrs.setdefault(node, {})
+
+    # 每个节点只有一条入边，边的属性按子节点保存
+    def edge_attributes(self, parent, node):
+        return self.edge_attrs.setdefault(node, {})
+
+    # 以传入节点为根的子树，复制为一棵新的树
+    def subtree(self, node):
+        subtree = TrieModelTree()
+        if "model_mapping" in self.__dict__:
+            subtree.model_mapping = self.model_mapping
+        to_visit = [(node, subtree.root)]
+        while to_visit:
+            current_node, subtree_node = to_visit.pop()
+            if current_node in self.models_table:
+                subtree.models_table[subtree_node] = set(self.models_table[current_node])
+            for child in self.children(current_node):
+                to_visit.append((child, subtree.add_child(subtree_node, self.label(child))))
+        return subtree
+
+    # 转换为ModelTree(节点为消息序列)，没有父节点的孤立子树不会被转换
+    # 根节点已被删除时返回空的ModelTree
+    def to_model_tree(self):
+        tree = ModelTree()
+        if "model_mapping" in self.__dict__:
+            tree.model_mapping = self.model_mapping
+        if self.root not in self:
+            return tree
+        tree.add_node(tree.root, **self.node_attrs.get(self.root, {}))
+        if self.root in self.models_table:
+            tree.set_models(tree.root, self.models_table[self.root])
+        to_visit = [(self.root, tree.root)]
+        while to_visit:
+            current_node, tree_node = to_visit.pop()
+            for child in self.children(current_node):
+                tree_child = tree.add_child(tree_node, self.label(child))
+                tree.nodes[tree_child].update(self.node_attrs.get(child, {}))
+                tree.edges[tree_node, tree_child].update(self.edge_attrs.get(child, {}))
+                if child in self.models_table:
+                    tree.set_models(tree_child, self.models_table[child])
+                to_visit.append((child, tree_child))
+        return tree
+
+    # 从ModelTree转换，子节点的顺序保持不变
+    @classmethod
+    def from_model_tree(cls, tree):
+        trie = cls()
+        if tree.root in tree:
+            trie.merge(tree)
+        for name in ("model_mapping", "similarity_index"):
+            if name in tree.__dict__:
+                setattr(trie, name, getattr(tree, name))
+        return trie
+
+    # 将一棵ModelTree合并到该树中，叶节点的状态机集合取并集
+    def merge(self, tree):
+        nodes = {tree.root: self.root}
+        for parent, node in tree.edges:
+            nodes[node] = self.add_child(nodes[parent], tree.label(node))
+        for leaf in tree.leaves:
+            models = tree.leaf_models(leaf)
+            if models:
+                self.set_models(nodes[leaf], self.leaf_models(nodes[leaf]) | models)
+
+    # 画出状态树
+    def draw(self, fmt="dot", path=None):
+        return self.to_model_tree().draw(fmt=fmt, path=path)
@@ -3,7 +3,7 @@ from collections import defaultdict
 from pathlib import Path
 
 import networkx
-from automata.automata import load_automaton_from_file
+from automata.automata import Automaton, load_automaton_from_file
 
 
 # 从dot文件读取状态机并去重
@@ -110,3 +110,32 @@ def convert_graph(graph, *, add_resets=False):
     converted["outputs"] = sorted(outputs)
 
     return
+
+
+def graph_to_automaton(graph):
+    """Convert a graph from DOT output (with a dummy `__start0` state) to an
+    Automaton. Every edge label "{{ sent }} / {{ received }}" becomes one
+    transition, so the input symbols are the labels used in the model tree.
+    States that do not define a label simply lack that transition."""
+    start = list(graph["__start0"])[0]
+    state_ids = {start: 0}
+    for node in graph.nodes:
+        if node != "__start0" and node not in state_ids:
+            state_ids[node] = len(state_ids)
+
+    automaton = Automaton(set())
+    for state in state_ids.values():
+        automaton.states[state] = {}
+    for source, destination, data in graph.edges(data=True):
+        if source == "__start0":
+            continue
+        sent, received = [
+            message.replace('"', "").strip()
+            for message in data["label"].split("/", maxsplit=1)
+        ]
+        automaton.input_vocabulary.add(sent)
+        automaton.states[state_ids[source]][sent] = (
+            state_ids[destination], [received], set()
+        )
+    return automaton
+
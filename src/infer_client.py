@@ -310,7 +310,7 @@ def main():
     with open(f"{args.output_dir}/final.automaton", "w", encoding="utf-8") as fd:
         fd.write(f"{automaton}\n")
     with open(f"{args.output_dir}/automaton.dot", "w", encoding="utf-8") as fd:
-        fd.write(automaton.dot())
+        automaton.dot_to(fd)
 
     log(f"n_queries={TLSBase.stats.nb_query}\n")
     log(f"n_submitted_queries={TLSBase.stats.nb_submited_query}\n")